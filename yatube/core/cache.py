@@ -0,0 +1,279 @@
+"""Двухуровневый кеш: L1 в памяти процесса перед общим L2.
+
+L1 — небольшой LocMemCache своего процесса, L2 — любой кеш из
+settings.CACHES, общий для всех воркеров (файловый, БД, memcached).
+Каждая запись и удаление публикуются в журнал инвалидаций — таблицу
+SQLite с автоинкрементным номером. Воркеры не чаще раза в POLL_INTERVAL
+секунд дочитывают журнал и выбрасывают устаревшие ключи из своего L1,
+так что чужая запись становится видна не позже чем через этот интервал.
+
+add атомарен и между процессами: проверку и запись в L2 он делает,
+заняв ключ в той же базе SQLite, поэтому блокировку вида
+cache.add(lock, ...) получает только один воркер.
+"""
+import os
+import sqlite3
+import threading
+import time
+from uuid import uuid4
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.locmem import LocMemCache
+
+CLEAR_ALL = '*'
+_MISSING = object()
+
+
+class InvalidationBus:
+    """Журнал инвалидаций в файле SQLite, общий для процессов."""
+
+    PRUNE_EVERY = 100
+    # Сколько секунд держится занятый ключ, если процесс упал внутри add.
+    CLAIM_TIMEOUT = 5
+
+    def __init__(self, path, retention):
+        self.path = path
+        self.retention = retention
+        self._token = uuid4().hex
+        self._published = 0
+        self._local = threading.local()
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    @property
+    def origin(self):
+        # После fork у дочернего воркера должен быть свой источник.
+        return f'{self._token}-{os.getpid()}'
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5,
+                                         isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS invalidations ('
+                'seq INTEGER PRIMARY KEY AUTOINCREMENT, origin TEXT, '
+                'key TEXT, version INTEGER, created REAL)'
+            )
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS claims ('
+                'key TEXT PRIMARY KEY, expires REAL)'
+            )
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def last_seq(self):
+        row = self._connection().execute(
+            'SELECT MAX(seq) FROM invalidations').fetchone()
+        return row[0] or 0
+
+    def publish(self, keys, version=None):
+        now = time.time()
+        connection = self._connection()
+        connection.executemany(
+            'INSERT INTO invalidations (origin, key, version, created) '
+            'VALUES (?, ?, ?, ?)',
+            [(self.origin, key, version, now) for key in keys],
+        )
+        self._published += 1
+        if self._published % self.PRUNE_EVERY == 0:
+            connection.execute('DELETE FROM invalidations WHERE created < ?',
+                               (now - self.retention,))
+            connection.execute('DELETE FROM claims WHERE expires < ?',
+                               (now,))
+
+    def claim(self, key):
+        """Занимает ключ; False, если его уже занял другой процесс.
+
+        Одна вставка с заменой только просроченной строки: SQLite
+        выполняет её целиком, поэтому из одновременных вызовов
+        успешен ровно один.
+        """
+        now = time.time()
+        cursor = self._connection().execute(
+            'INSERT INTO claims (key, expires) VALUES (?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET expires = excluded.expires '
+            'WHERE claims.expires < ?',
+            (key, now + self.CLAIM_TIMEOUT, now),
+        )
+        return cursor.rowcount == 1
+
+    def release(self, key):
+        self._connection().execute('DELETE FROM claims WHERE key = ?',
+                                   (key,))
+
+    def read(self, after):
+        """Чужие инвалидации после after и признак пропуска в журнале."""
+        connection = self._connection()
+        rows = connection.execute(
+            'SELECT seq, origin, key, version FROM invalidations '
+            'WHERE seq > ? ORDER BY seq', (after,)).fetchall()
+        oldest = connection.execute(
+            'SELECT MIN(seq) FROM invalidations').fetchone()[0]
+        gap = after and oldest is not None and oldest > after + 1
+        return rows, bool(gap)
+
+
+class TwoTierCache(BaseCache):
+    """Кеш с L1 в процессе, общим L2 и рассылкой инвалидаций.
+
+    OPTIONS: L2 — имя кеша второго уровня, BUS — путь к журналу
+    инвалидаций, L1_MAX_ENTRIES и L1_TIMEOUT — размер и время жизни L1,
+    POLL_INTERVAL — как часто читать журнал, RETENTION — сколько секунд
+    хранить записи журнала.
+    """
+
+    def __init__(self, location, params):
+        options = dict(params.get('OPTIONS', {}))
+        self._l2_alias = options.pop('L2')
+        bus_path = options.pop('BUS')
+        l1_max_entries = options.pop('L1_MAX_ENTRIES', 1000)
+        self.l1_timeout = options.pop('L1_TIMEOUT', 60)
+        self.poll_interval = options.pop('POLL_INTERVAL', 0.25)
+        retention = options.pop('RETENTION', 600)
+        super().__init__(dict(params, OPTIONS=options))
+        self.l1 = LocMemCache(f'two-tier-l1-{location}', {
+            'TIMEOUT': self.l1_timeout,
+            'OPTIONS': {'MAX_ENTRIES': l1_max_entries},
+        })
+        self.bus = InvalidationBus(bus_path, retention)
+        self._seq = self.bus.last_seq()
+        self._polled = time.monotonic()
+        self._poll_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = dict.fromkeys(
+            ('l1_hits', 'l1_misses', 'l2_hits', 'l2_misses'), 0)
+
+    @property
+    def l2(self):
+        return caches[self._l2_alias]
+
+    def _count(self, **deltas):
+        with self._stats_lock:
+            for name, delta in deltas.items():
+                self._stats[name] += delta
+
+    def stats(self):
+        """Попадания и промахи по уровням в этом процессе."""
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def _l1_timeout(self, timeout):
+        if timeout == DEFAULT_TIMEOUT or timeout is None:
+            return self.l1_timeout
+        return min(timeout, self.l1_timeout)
+
+    def poll(self, force=False):
+        """Выбрасывает из L1 ключи, изменённые другими процессами."""
+        now = time.monotonic()
+        if not force and now - self._polled < self.poll_interval:
+            return
+        if not self._poll_lock.acquire(blocking=False):
+            return
+        try:
+            self._polled = now
+            rows, gap = self.bus.read(self._seq)
+            if gap:
+                self.l1.clear()
+            origin_self = self.bus.origin
+            for seq, origin, key, version in rows:
+                self._seq = seq
+                if origin == origin_self:
+                    continue
+                if key == CLEAR_ALL:
+                    self.l1.clear()
+                else:
+                    self.l1.delete(key, version=version)
+        finally:
+            self._poll_lock.release()
+
+    def _invalidate(self, keys, version=None):
+        self.bus.publish(keys, version)
+
+    def get(self, key, default=None, version=None):
+        self.poll()
+        value = self.l1.get(key, _MISSING, version=version)
+        if value is not _MISSING:
+            self._count(l1_hits=1)
+            return value
+        value = self.l2.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            self._count(l1_misses=1, l2_misses=1)
+            return default
+        self._count(l1_misses=1, l2_hits=1)
+        self.l1.set(key, value, version=version)
+        return value
+
+    def get_many(self, keys, version=None):
+        self.poll()
+        keys = list(keys)
+        found = self.l1.get_many(keys, version=version)
+        missing = [key for key in keys if key not in found]
+        if missing:
+            from_l2 = self.l2.get_many(missing, version=version)
+            if from_l2:
+                self.l1.set_many(from_l2, version=version)
+            found.update(from_l2)
+            self._count(l2_hits=len(from_l2),
+                        l2_misses=len(missing) - len(from_l2))
+        self._count(l1_hits=len(keys) - len(missing),
+                    l1_misses=len(missing))
+        return found
+
+    def has_key(self, key, version=None):
+        return self.get(key, _MISSING, version=version) is not _MISSING
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.l2.set(key, value, timeout, version=version)
+        self.l1.set(key, value, self._l1_timeout(timeout), version=version)
+        self._invalidate([key], version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        # add файлового кеша — проверка и запись по отдельности, поэтому
+        # на это время ключ занимается в журнале.
+        claim = self.make_key(key, version)
+        if not self.bus.claim(claim):
+            return False
+        try:
+            if not self.l2.add(key, value, timeout, version=version):
+                return False
+        finally:
+            self.bus.release(claim)
+        self.l1.set(key, value, self._l1_timeout(timeout), version=version)
+        self._invalidate([key], version)
+        return True
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.l2.set_many(data, timeout, version=version)
+        self.l1.set_many(data, self._l1_timeout(timeout), version=version)
+        self._invalidate(list(data), version)
+        return failed
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self.l1.delete(key, version=version)
+        return self.l2.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self.l2.delete(key, version=version)
+        self.l1.delete(key, version=version)
+        self._invalidate([key], version)
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self.l2.delete_many(keys, version=version)
+        self.l1.delete_many(keys, version=version)
+        self._invalidate(keys, version)
+
+    def incr(self, key, delta=1, version=None):
+        value = self.l2.incr(key, delta, version=version)
+        self.l1.delete(key, version=version)
+        self._invalidate([key], version)
+        return value
+
+    def clear(self):
+        self.l2.clear()
+        self.l1.clear()
+        self._invalidate([CLEAR_ALL])
@@ -0,0 +1,73 @@
+"""Фрагменты страниц, зависящие от того, кто смотрит.
+
+Закешированная страница хранится одна на всех: вместо шапки, формы
+комментария и других частей, зависящих от пользователя, в ней стоят
+метки. На каждом запросе метки заменяются фрагментами, отрисованными
+для текущего пользователя. Фрагменты маленькие и почти не читают
+базу, поэтому кешированную страницу получают и вошедшие пользователи.
+
+Фрагмент регистрируется декоратором fragment и вставляется в шаблон
+тегом {% hole 'имя' аргумент=значение %}; аргументы — строки, числа
+и логические значения, они сохраняются в метке.
+"""
+import json
+import re
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from contextlib import contextmanager
+
+from django.template.loader import render_to_string
+
+HOLE = re.compile(r'<!--hole:([\w-]+):([\w=-]*)-->')
+
+_fragments = {}
+
+
+def fragment(name, template_name):
+    """Регистрирует фрагмент; функция собирает его контекст.
+
+    Функция получает запрос и аргументы из шаблона и возвращает
+    словарь контекста для template_name.
+    """
+    def decorator(context):
+        _fragments[name] = (template_name, context)
+        return context
+    return decorator
+
+
+def render_fragment(request, name, kwargs):
+    template_name, context = _fragments[name]
+    return render_to_string(template_name, context(request, **kwargs),
+                            request=request)
+
+
+def marker(name, kwargs):
+    payload = urlsafe_b64encode(json.dumps(kwargs).encode()).decode()
+    return f'<!--hole:{name}:{payload}-->'
+
+
+def punching(request):
+    """Рисует ли сейчас запрос страницу для общего кеша."""
+    return getattr(request, '_punch_holes', False)
+
+
+@contextmanager
+def punched(request):
+    """Внутри блока тег hole оставляет метки вместо фрагментов."""
+    request._punch_holes = True
+    try:
+        yield
+    finally:
+        request._punch_holes = False
+
+
+def fill(request, body):
+    """Подставляет в страницу фрагменты для текущего пользователя."""
+    def replace(match):
+        kwargs = json.loads(urlsafe_b64decode(match[2].encode()))
+        return render_fragment(request, match[1], kwargs)
+    return HOLE.sub(replace, body)
+
+
+@fragment('header', 'includes/header.html')
+def header(request):
+    return {}
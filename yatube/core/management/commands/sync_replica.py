@@ -0,0 +1,45 @@
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core.replicas import copy_sqlite
+
+
+class Command(BaseCommand):
+    help = ('Копирует основную базу SQLite в локальные реплики, чтобы '
+            'проверять чтение с реплик без настоящей репликации.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'aliases', nargs='*',
+            help='Псевдонимы реплик; по умолчанию все, кроме default.')
+        parser.add_argument(
+            '--keep-cache', action='store_true',
+            help='Не сбрасывать кеш страниц после копирования.')
+
+    def handle(self, *args, **options):
+        source = connections['default'].settings_dict
+        aliases = options['aliases'] or [
+            alias for alias in connections if alias != 'default']
+        if source['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError('Команда копирует только базы SQLite; '
+                               'настоящие реплики обновляет СУБД.')
+        for alias in aliases:
+            if alias not in connections or alias == 'default':
+                raise CommandError(f'Нет реплики {alias!r}.')
+            target = connections[alias].settings_dict
+            if target['ENGINE'] != source['ENGINE']:
+                raise CommandError(f'Реплика {alias!r} — не SQLite.')
+            connections[alias].close()
+            started = time.perf_counter()
+            copy_sqlite(source['NAME'], target['NAME'])
+            self.stdout.write(
+                f'{alias}: скопировано за '
+                f'{time.perf_counter() - started:.1f} с')
+        if not options['keep_cache']:
+            # Страницы, собранные со старой копии, лежат в кеше под
+            # актуальными версиями и пережили бы синхронизацию.
+            cache.clear()
+        self.stdout.write(self.style.SUCCESS('Реплики обновлены'))
@@ -0,0 +1,195 @@
+"""Профилирование SQL по запросам к сайту.
+
+Middleware выбирает долю запросов (SAMPLE_RATE) и на время их
+обработки оборачивает соединения с БД через execute_wrapper. Для
+каждого выбранного запроса записываются число запросов к БД, суммарное
+время SQL, повторяющиеся отпечатки запросов (признак N+1) и самые
+медленные запросы с планом EXPLAIN QUERY PLAN. Запись уходит в
+кольцевой буфер процесса, в сводку по представлениям и в журнал
+core.profiling, который в настройках пишется в ротируемый файл.
+
+Остальные запросы к сайту не оборачиваются вовсе, поэтому middleware
+можно держать включённым в продакшене.
+"""
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from collections import Counter, deque
+from contextlib import ExitStack
+from logging.handlers import RotatingFileHandler
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'SAMPLE_RATE': 0.0,
+    'SLOW_QUERY_MS': 100,
+    'MAX_SLOW_QUERIES': 5,
+    'BUFFER_SIZE': 500,
+}
+# Списки IN разной длины — один и тот же запрос.
+PLACEHOLDER_LIST = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+
+
+def profiling_settings():
+    return {**DEFAULTS, **getattr(settings, 'SQL_PROFILING', {})}
+
+
+def fingerprint(sql):
+    """Короткий отпечаток SQL без значений параметров."""
+    return format(zlib.crc32(PLACEHOLDER_LIST.sub('(%s)', sql).encode()),
+                  '08x')
+
+
+class QueryRecorder:
+    """Обёртка execute_wrapper, собирающая статистику одного запроса."""
+
+    def __init__(self, slow_ms):
+        self.slow_ms = slow_ms
+        self.count = 0
+        self.total_ms = 0.0
+        self.fingerprints = Counter()
+        self.samples = {}
+        self.slow = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            self.count += 1
+            self.total_ms += elapsed
+            key = fingerprint(sql)
+            self.fingerprints[key] += 1
+            self.samples.setdefault(key, sql)
+            if elapsed >= self.slow_ms and not many:
+                self.slow.append({
+                    'alias': context['connection'].alias,
+                    'sql': sql,
+                    'params': params,
+                    'ms': round(elapsed, 3),
+                })
+
+    def duplicates(self):
+        return [
+            {'fingerprint': key, 'count': count, 'sql': self.samples[key]}
+            for key, count in self.fingerprints.most_common()
+            if count > 1
+        ]
+
+
+def explain(alias, sql, params):
+    """План запроса; для не-SELECT и ошибок возвращает None."""
+    if not sql.lstrip().upper().startswith('SELECT'):
+        return None
+    connection = connections[alias]
+    prefix = ('EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite'
+              else 'EXPLAIN ')
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            return [' '.join(str(col) for col in row)
+                    for row in cursor.fetchall()]
+    except Exception:
+        return None
+
+
+class Profile:
+    """Кольцевой буфер последних записей и сводка по представлениям."""
+
+    def __init__(self, size):
+        self.records = deque(maxlen=size)
+        self._views = {}
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        self.records.append(record)
+        with self._lock:
+            view = self._views.setdefault(record['view'], {
+                'requests': 0, 'queries': 0, 'sql_ms': 0.0,
+                'duplicates': 0, 'slow': 0,
+            })
+            view['requests'] += 1
+            view['queries'] += record['queries']
+            view['sql_ms'] += record['sql_ms']
+            view['duplicates'] += sum(
+                item['count'] - 1 for item in record['duplicates'])
+            view['slow'] += len(record['slow'])
+
+    def summary(self):
+        """Средние по каждому представлению с начала работы процесса."""
+        with self._lock:
+            return {
+                name: {
+                    **view,
+                    'avg_queries': view['queries'] / view['requests'],
+                    'avg_sql_ms': view['sql_ms'] / view['requests'],
+                }
+                for name, view in self._views.items()
+            }
+
+    def clear(self):
+        self.records.clear()
+        with self._lock:
+            self._views.clear()
+
+
+profile = Profile(profiling_settings()['BUFFER_SIZE'])
+
+
+class SQLProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        options = profiling_settings()
+        if random.random() >= options['SAMPLE_RATE']:
+            return self.get_response(request)
+        recorder = QueryRecorder(options['SLOW_QUERY_MS'])
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        elapsed = (time.perf_counter() - started) * 1000
+        self.record(request, response, recorder, elapsed, options)
+        return response
+
+    def record(self, request, response, recorder, elapsed, options):
+        match = request.resolver_match
+        slow = sorted(recorder.slow, key=lambda query: -query['ms'])
+        slow = slow[:options['MAX_SLOW_QUERIES']]
+        # EXPLAIN — уже вне обёртки, чтобы не попасть в статистику.
+        for query in slow:
+            query['plan'] = explain(query['alias'], query['sql'],
+                                    query['params'])
+            query['params'] = repr(query['params'])
+        record = {
+            'time': time.time(),
+            'view': match.view_name if match else request.path,
+            'path': request.path,
+            'status': response.status_code,
+            'ms': round(elapsed, 3),
+            'queries': recorder.count,
+            'sql_ms': round(recorder.total_ms, 3),
+            'duplicates': recorder.duplicates(),
+            'slow': slow,
+        }
+        profile.add(record)
+        logger.info(json.dumps(record, ensure_ascii=False, default=str))
+
+
+class ProfileLogHandler(RotatingFileHandler):
+    """RotatingFileHandler, который сам создаёт каталог журнала."""
+
+    def __init__(self, filename, *args, **kwargs):
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        super().__init__(filename, *args, **kwargs)
@@ -0,0 +1,153 @@
+"""Чтение с реплик базы данных.
+
+Представления, помеченные replica_reads, читают с одной из реплик из
+settings.DATABASE_REPLICAS; всё остальное и любые записи идут в
+основную базу. Пустой список реплик отключает маршрутизацию.
+
+Реплика отстаёт от основной базы, поэтому пользователь, который что-то
+записал, ещё REPLICA_STICKY_SECONDS секунд читает с основной базы и
+видит свой пост или комментарий. Срок хранится в cookie, а не в
+сессии: проверка не стоит ни одного запроса. Сессии всегда читаются
+с основной базы, иначе свежий вход терялся бы на отставшей реплике.
+
+То, что кладётся в кеш надолго, не должно собираться из отставшей
+реплики: иначе старые данные лягут под новые версии и провисят до
+следующего изменения. Поэтому сборки для кеша идут через cache_reads и
+читают реплику, только когда она заведомо видит все изменения.
+
+Локально реплика — копия db.sqlite3, которую обновляет команда
+sync_replica.
+"""
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+
+STICKY_COOKIE = 'primary_until'
+PRIMARY_APPS = {'sessions'}
+
+_state = threading.local()
+
+
+def _replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', ()))
+
+
+def pinned():
+    """Прикреплён ли текущий запрос к основной базе после записи."""
+    return getattr(_state, 'pinned', False)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if (getattr(_state, 'replica_reads', False)
+                and not getattr(_state, 'pinned', False)
+                and model._meta.app_label not in PRIMARY_APPS):
+            replicas = _replicas()
+            if replicas:
+                return random.choice(replicas)
+        return None
+
+    def db_for_write(self, model, **hints):
+        # После записи до конца запроса читаем только с основной базы.
+        _state.pinned = True
+        _state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # На репликах те же данные, что и в основной базе.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+def replica_reads(view):
+    """Разрешает представлению читать с реплики."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        previous = getattr(_state, 'replica_reads', False)
+        _state.replica_reads = True
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _state.replica_reads = previous
+    return wrapper
+
+
+def settled(changed):
+    """Видят ли реплики изменения, сделанные в моменты changed.
+
+    changed — целые секунды (как во времени версий кеша); None —
+    момент неизвестен. REPLICA_MAX_LAG=0 — реплики не отстают.
+    """
+    lag = settings.REPLICA_MAX_LAG
+    if lag <= 0:
+        return True
+    # Момент округлён вниз до секунды: изменение могло быть на секунду
+    # позже.
+    horizon = time.time() - lag - 1
+    return all(moment is not None and moment <= horizon
+               for moment in changed)
+
+
+@contextmanager
+def cache_reads(changed=None):
+    """Чтения для сборки того, что ляжет в кеш.
+
+    Внутри блока читается основная база, если реплика может ещё не
+    видеть изменений в моменты changed (см. settled). Без changed
+    момент неизвестен и реплика читается, только если она не отстаёт.
+    """
+    previous = getattr(_state, 'replica_reads', False)
+    if not settled(changed or [None]):
+        _state.replica_reads = False
+    try:
+        yield
+    finally:
+        _state.replica_reads = previous
+
+
+class ReplicaMiddleware:
+    """Прикрепляет к основной базе того, кто недавно писал."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            until = float(request.COOKIES.get(STICKY_COOKIE, 0))
+        except ValueError:
+            until = 0
+        _state.pinned = until > time.time()
+        _state.wrote = False
+        try:
+            response = self.get_response(request)
+            if _state.wrote:
+                seconds = settings.REPLICA_STICKY_SECONDS
+                response.set_cookie(
+                    STICKY_COOKIE, f'{time.time() + seconds:.3f}',
+                    max_age=seconds, httponly=True, samesite='Lax')
+        finally:
+            _state.pinned = False
+            _state.wrote = False
+        return response
+
+
+def copy_sqlite(source, target, pages=1024):
+    """Согласованная копия базы SQLite через online backup API.
+
+    Пишущие в основную базу не блокируются дольше, чем на копирование
+    pages страниц за шаг.
+    """
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(target)
+    try:
+        src.backup(dst, pages=pages)
+    finally:
+        dst.close()
+        src.close()
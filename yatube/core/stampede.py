@@ -0,0 +1,121 @@
+"""Защита кешированных страниц от лавины перестроек.
+
+Когда запись страницы в кеше пропадает (сменилась версия области или
+истёк срок), все воркеры, получившие промах одновременно, стали бы
+собирать её заново и вместе пошли бы в базу. Здесь страницу собирает
+только воркер, взявший блокировку в кеше. Остальные отдают прошлую
+копию страницы, если она есть, или недолго ждут новую.
+
+Кроме того, запись может пересобираться заранее, до истечения срока:
+с вероятностью, растущей к концу срока и пропорциональной времени
+сборки (алгоритм XFetch). Тогда горячая страница обновляется одним
+воркером, пока остальные ещё читают действующую запись.
+
+Счётчики пересборок, заранних пересборок, отданных старых копий и
+ожиданий ведутся по именам страниц в памяти процесса, см. stats.
+"""
+import math
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+
+DEFAULTS = {
+    # Сколько живёт блокировка сборки, если воркер упал, не сняв её.
+    'LOCK_TIMEOUT': 10,
+    # Сколько ждать чужую сборку, когда старой копии нет, и как часто
+    # проверять кеш.
+    'WAIT': 2.0,
+    'WAIT_STEP': 0.05,
+    # Множитель XFetch: больше — раньше пересборка; 0 — отключить.
+    'BETA': 1.0,
+    # Сколько хранится прошлая копия страницы.
+    'STALE_TIMEOUT': 60 * 60,
+}
+
+_stats_lock = threading.Lock()
+_stats = defaultdict(Counter)
+
+
+def stampede_settings():
+    return {**DEFAULTS, **getattr(settings, 'STAMPEDE', {})}
+
+
+def _count(name, event):
+    with _stats_lock:
+        _stats[name][event] += 1
+
+
+def stats():
+    """События по именам страниц в этом процессе.
+
+    rebuild — сборка после промаха, early — заранняя сборка, stale —
+    отдана прошлая копия, waited — дождались чужой сборки, gave_up —
+    не дождались и собрали сами. Объединёнными считаются stale и
+    waited: на столько сборок меньше дошло до базы.
+    """
+    with _stats_lock:
+        return {name: dict(events) for name, events in _stats.items()}
+
+
+def _early(expires, delta, beta, now):
+    # -log(random()) — экспонента со средним 1: чем дольше сборка и
+    # ближе конец срока, тем вероятнее пересобрать заранее.
+    return now - delta * beta * math.log(1 - random.random()) >= expires
+
+
+def _build(key, stale_key, timeout, build, options):
+    started = time.monotonic()
+    try:
+        value = build()
+        if value is not None:
+            delta = time.monotonic() - started
+            cache.set(key, (value, time.time() + timeout, delta), timeout)
+            if stale_key:
+                cache.set(stale_key, value, options['STALE_TIMEOUT'])
+        return value
+    finally:
+        cache.delete(f'lock:{key}')
+
+
+def get_or_build(name, key, build, timeout, stale_key=None,
+                 allow_stale=True, on_stale=None):
+    """Значение из кеша под key; собирает его только один воркер.
+
+    build возвращает значение для кеша или None, если сохранять
+    нечего. stale_key — ключ прошлой копии, общий для всех версий
+    страницы; allow_stale=False заставляет ждать свежую сборку.
+    on_stale вызывается, если отдаётся прошлая копия.
+    """
+    options = stampede_settings()
+    lock = f'lock:{key}'
+    entry = cache.get(key)
+    if entry is not None:
+        value, expires, delta = entry
+        if (_early(expires, delta, options['BETA'], time.time())
+                and cache.add(lock, 1, options['LOCK_TIMEOUT'])):
+            _count(name, 'early')
+            return _build(key, stale_key, timeout, build, options)
+        return value
+    if cache.add(lock, 1, options['LOCK_TIMEOUT']):
+        _count(name, 'rebuild')
+        return _build(key, stale_key, timeout, build, options)
+    if allow_stale and stale_key:
+        value = cache.get(stale_key)
+        if value is not None:
+            _count(name, 'stale')
+            if on_stale:
+                on_stale()
+            return value
+    deadline = time.monotonic() + options['WAIT']
+    while time.monotonic() < deadline:
+        time.sleep(options['WAIT_STEP'])
+        entry = cache.get(key)
+        if entry is not None:
+            _count(name, 'waited')
+            return entry[0]
+    _count(name, 'gave_up')
+    return build()
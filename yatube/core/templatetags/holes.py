@@ -0,0 +1,14 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from core.holes import marker, punching, render_fragment
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def hole(context, name, **kwargs):
+    request = context['request']
+    if punching(request):
+        return mark_safe(marker(name, kwargs))
+    return mark_safe(render_fragment(request, name, kwargs))
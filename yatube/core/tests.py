@@ -0,0 +1,280 @@
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, connections
+from django.test import (SimpleTestCase, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Post
+from . import stampede
+from .cache import TwoTierCache
+from .profiling import QueryRecorder, fingerprint, profile
+from .replicas import STICKY_COOKIE, copy_sqlite
+
+TEMP_DIR = tempfile.mkdtemp()
+
+
+@override_settings(CACHES={
+    'l2': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+           'LOCATION': 'two-tier-tests'},
+})
+class TwoTierCacheTests(SimpleTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_DIR, ignore_errors=True)
+
+    def make_worker(self, name):
+        '''Отдельный экземпляр кеша изображает отдельный процесс'''
+        return TwoTierCache(name, {'OPTIONS': {
+            'L2': 'l2',
+            'BUS': os.path.join(TEMP_DIR, 'bus.sqlite3'),
+            'POLL_INTERVAL': 0,
+        }})
+
+    def setUp(self):
+        self.first = self.make_worker('first')
+        self.second = self.make_worker('second')
+        self.first.clear()
+        self.second.l1.clear()
+
+    def test_value_shared_through_l2(self):
+        '''Значение, записанное одним воркером, видно другому'''
+        self.first.set('key', 'value')
+        self.assertEqual(self.second.get('key'), 'value')
+        self.assertEqual(self.second.stats()['l2_hits'], 1)
+        self.assertEqual(self.second.get('key'), 'value')
+        self.assertEqual(self.second.stats()['l1_hits'], 1)
+
+    def test_invalidation_reaches_other_l1(self):
+        '''Запись и удаление сбрасывают L1 других воркеров'''
+        self.first.set('key', 'old')
+        self.assertEqual(self.second.get('key'), 'old')
+        self.first.set('key', 'new')
+        self.assertEqual(self.second.get('key'), 'new')
+        self.first.delete('key')
+        self.assertIsNone(self.second.get('key'))
+
+    def test_clear_reaches_other_l1(self):
+        self.first.set_many({'a': 1, 'b': 2})
+        self.assertEqual(self.second.get_many(['a', 'b']), {'a': 1, 'b': 2})
+        self.first.clear()
+        self.assertEqual(self.second.get_many(['a', 'b']), {})
+        self.assertEqual(self.second.stats()['l2_misses'], 2)
+
+    @override_settings(CACHES={
+        'l2': {'BACKEND':
+               'django.core.cache.backends.filebased.FileBasedCache',
+               'LOCATION': os.path.join(TEMP_DIR, 'l2')},
+    })
+    def test_add_atomic_across_processes(self):
+        '''add файлового L2 из разных процессов удаётся одному'''
+        self.first.clear()
+        context = multiprocessing.get_context('fork')
+        workers, rounds = 8, 20
+        barrier = context.Barrier(workers)
+        results = context.Queue()
+
+        def add_locks(name):
+            worker = self.make_worker(name)
+            for number in range(rounds):
+                barrier.wait()
+                results.put(worker.add(f'lock:{number}', name, 10))
+
+        processes = [context.Process(target=add_locks, args=(f'w{i}',))
+                     for i in range(workers)]
+        for process in processes:
+            process.start()
+        added = [results.get(timeout=30)
+                 for _ in range(workers * rounds)]
+        for process in processes:
+            process.join()
+        self.assertEqual(added.count(True), rounds)
+
+
+class SQLProfilingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        profile.clear()
+
+    @override_settings(SQL_PROFILING={'SAMPLE_RATE': 1, 'SLOW_QUERY_MS': 0})
+    def test_sampled_request_recorded(self):
+        '''Выбранный запрос попадает в буфер с планами медленных запросов'''
+        self.client.get(reverse('posts:index'))
+        record = profile.records[-1]
+        self.assertEqual(record['view'], 'posts:index')
+        self.assertGreater(record['queries'], 0)
+        self.assertTrue(record['slow'])
+        self.assertTrue(any(query['plan'] for query in record['slow']))
+        self.assertEqual(profile.summary()['posts:index']['requests'], 1)
+
+    @override_settings(SQL_PROFILING={'SAMPLE_RATE': 0})
+    def test_unsampled_request_skipped(self):
+        '''Невыбранные запросы не профилируются'''
+        self.client.get(reverse('posts:index'))
+        self.assertFalse(profile.records)
+
+    def test_duplicates_by_fingerprint(self):
+        '''Повторы одного запроса с разными параметрами видны как дубли'''
+        self.assertEqual(fingerprint('SELECT 1 WHERE id IN (%s, %s)'),
+                         fingerprint('SELECT 1 WHERE id IN (%s, %s, %s)'))
+        recorder = QueryRecorder(slow_ms=1000)
+        users = get_user_model().objects
+        with connection.execute_wrapper(recorder):
+            users.filter(pk=1).first()
+            users.filter(pk=2).first()
+            users.count()
+        self.assertEqual(recorder.count, 3)
+        [duplicate] = recorder.duplicates()
+        self.assertEqual(duplicate['count'], 2)
+
+
+# Зеркало в тестах не отстаёт от основной базы.
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_MAX_LAG=0)
+class ReplicaRoutingTests(TransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='auth')
+        self.post = Post.objects.create(author=self.user, text='Пост')
+
+    def tables_read(self, alias, url, **extra):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            response = self.client.get(url, **extra)
+        self.assertEqual(response.status_code, 200)
+        captured = {'default': primary, 'replica': replica}[alias]
+        return ' '.join(query['sql'] for query in captured.captured_queries)
+
+    def test_feed_reads_from_replica(self):
+        '''Лента читает посты с реплики, а сессию — с основной базы'''
+        self.client.force_login(self.user)
+        url = reverse('posts:index')
+        self.assertIn('posts_post', self.tables_read('replica', url))
+        # Сессии нет в кеше: она читается из базы.
+        cache.clear()
+        primary = self.tables_read('default', reverse('posts:profile',
+                                                      args=['auth']))
+        self.assertIn('django_session', primary)
+        self.assertNotIn('posts_post', primary)
+
+    def test_writer_pinned_to_primary(self):
+        '''После записи пользователь какое-то время читает основную базу'''
+        self.client.force_login(self.user)
+        self.client.cookies.pop(STICKY_COOKIE, None)
+        response = self.client.post(
+            reverse('posts:add_comment', args=[self.post.pk]),
+            {'text': 'Комментарий'})
+        self.assertIn(STICKY_COOKIE, response.cookies)
+        url = reverse('posts:post_detail', args=[self.post.pk])
+        self.assertIn('posts_comment', self.tables_read('default', url))
+        self.assertNotIn('posts_', self.tables_read('replica', url))
+
+        self.client.cookies[STICKY_COOKIE] = '0'
+        # Страница уже в кеше: сбрасываем его, чтобы она собралась заново.
+        cache.clear()
+        self.assertIn('posts_comment', self.tables_read('replica', url))
+
+    @override_settings(REPLICA_MAX_LAG=60)
+    def test_fresh_changes_cached_from_primary(self):
+        '''Недавно изменённое собирается для кеша с основной базы'''
+        self.client.force_login(self.user)
+        for url in (reverse('posts:index'),
+                    reverse('posts:profile', args=['auth']),
+                    reverse('posts:follow_index')):
+            with self.subTest(url=url):
+                self.assertNotIn('posts_', self.tables_read('replica', url))
+        with CaptureQueriesContext(connections['replica']) as replica:
+            response = self.client.get(reverse('posts:group_list',
+                                               args=['new']))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(replica.captured_queries, [])
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas_configured(self):
+        '''Без реплик всё читается с основной базы'''
+        url = reverse('posts:index')
+        self.assertIn('posts_post', self.tables_read('default', url))
+
+    def test_copy_sqlite(self):
+        '''Копия SQLite содержит данные основной базы'''
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp, 'primary.sqlite3')
+            target = os.path.join(tmp, 'replica.sqlite3')
+            db = sqlite3.connect(source)
+            db.execute('CREATE TABLE t (x)')
+            db.execute('INSERT INTO t VALUES (1)')
+            db.commit()
+            db.close()
+            copy_sqlite(source, target)
+            copy = sqlite3.connect(target)
+            self.assertEqual(copy.execute('SELECT x FROM t').fetchall(),
+                             [(1,)])
+            copy.close()
+
+
+@override_settings(STAMPEDE={'WAIT': 1.0, 'WAIT_STEP': 0.01})
+class StampedeTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.builds = 0
+
+    def build(self, value='новая', delay=0):
+        def build():
+            time.sleep(delay)
+            self.builds += 1
+            return value
+        return build
+
+    def events(self, name):
+        return stampede.stats().get(name, {})
+
+    def test_concurrent_misses_build_once(self):
+        '''Одновременные промахи собирают страницу один раз'''
+        before = self.events('concurrent').get('waited', 0)
+        build = self.build(delay=0.2)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(
+                lambda _: stampede.get_or_build('concurrent', 'page',
+                                                build, 60),
+                range(8)))
+        self.assertEqual(results, ['новая'] * 8)
+        self.assertEqual(self.builds, 1)
+        self.assertEqual(self.events('concurrent')['waited'] - before, 7)
+
+    def test_stale_copy_served_while_locked(self):
+        '''Пока страницу собирает другой воркер, отдаётся прошлая копия'''
+        stampede.get_or_build('stale', 'page:v1', self.build('старая'), 60,
+                              stale_key='page')
+        cache.add('lock:page:v2', 1)
+        stale = []
+        self.assertEqual(stampede.get_or_build(
+            'stale', 'page:v2', self.build(), 60, stale_key='page',
+            on_stale=lambda: stale.append(True)), 'старая')
+        self.assertEqual(self.builds, 1)
+        self.assertEqual(stale, [True])
+        with override_settings(STAMPEDE={'WAIT': 0.05, 'WAIT_STEP': 0.01}):
+            self.assertEqual(stampede.get_or_build(
+                'stale', 'page:v2', self.build(), 60, stale_key='page',
+                allow_stale=False), 'новая')
+
+    def test_early_recompute_near_expiry(self):
+        '''Запись у конца срока пересобирается заранее'''
+        cache.set('page', ('старая', time.time() + 1, 0.5), 60)
+        with override_settings(STAMPEDE={'BETA': 0}):
+            self.assertEqual(stampede.get_or_build(
+                'early', 'page', self.build(), 60), 'старая')
+        with override_settings(STAMPEDE={'BETA': 1000}):
+            self.assertEqual(stampede.get_or_build(
+                'early', 'page', self.build(), 60), 'новая')
+        self.assertEqual(self.events('early')['early'], 1)
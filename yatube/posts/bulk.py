@@ -0,0 +1,365 @@
+"""Массовая загрузка данных в обход сигналов.
+
+bulk_create не вызывает сигналы, поэтому после него производные данные
+— счётчики, ленты подписок, поисковый индекс и версии страниц в кеше —
+пересобираются одним проходом в rebuild_derived.
+
+Импорт читает JSONL или CSV потоком и пишет пачками через bulk_create.
+Пользователи и группы в записях указываются естественными ключами
+(username и slug), посты — своим id: он сохраняется как первичный ключ,
+поэтому комментарии ссылаются на посты из той же выгрузки. Ключи
+разрешаются по пачке одним запросом и запоминаются в ограниченной
+карте, так что память не растёт вместе с размером файла.
+
+Запись с полем type загружается только при загрузке своего вида
+(type — вид в единственном числе: post, comment и т. д.). Так выгрузка
+export_data, где посты и комментарии лежат в одном JSONL, загружается
+тем же файлом дважды: posts=файл comments=файл.
+
+После каждой транзакции номер последней записанной записи файла
+сохраняется в файл контрольной точки; повторный запуск пропускает уже
+записанное.
+Все вставки идут с ignore_conflicts, поэтому записи с id повторно не
+создаются, даже если процесс упал между коммитом и сохранением точки.
+"""
+import csv
+import itertools
+import json
+import os
+import time
+from contextlib import contextmanager
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import counters, search, timeline
+from .models import Comment, Follow, Group, Post, User
+
+# Порядок, в котором виды данных зависят друг от друга.
+KINDS = ('users', 'groups', 'posts', 'comments', 'follows')
+# Значение поля type у записей каждого вида.
+RECORD_TYPES = {kind: kind[:-1] for kind in KINDS}
+FORMATS = ('jsonl', 'csv')
+# С запасом ниже ограничения SQLite на число параметров запроса.
+LOOKUP_BATCH = 500
+
+
+@contextmanager
+def explicit_dates(*fields):
+    """Временно отключает auto_now_add, чтобы сохранить заданные даты."""
+    saved = [(field, field.auto_now_add) for field in fields]
+    try:
+        for field, _ in saved:
+            field.auto_now_add = False
+        yield
+    finally:
+        for field, value in saved:
+            field.auto_now_add = value
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def rebuild_derived(batch_size=1000, log=None):
+    """Пересобирает всё, что сигналы поддерживают при обычной записи."""
+    steps = [
+        ('счётчики', lambda: counters.rebuild_all(batch_size)),
+        ('ленты подписок', lambda: timeline.rebuild_timelines(batch_size)),
+        ('поисковый индекс', lambda: search.rebuild(batch_size)),
+        ('кеш страниц', cache.clear),
+    ]
+    for name, step in steps:
+        step()
+        if log:
+            log(f'Пересобрано: {name}')
+
+
+class BadRecord(ValueError):
+    """Запись входного файла, которую нельзя загрузить."""
+
+
+def detect_format(path):
+    return 'csv' if path.lower().endswith('.csv') else 'jsonl'
+
+
+def read_records(path, fmt, skip=0):
+    """Записи файла словарями, начиная с записи номер skip."""
+    with open(path, encoding='utf-8', newline='') as source:
+        if fmt == 'csv':
+            records = itertools.islice(csv.DictReader(source), skip, None)
+        else:
+            lines = (line for line in source if line.strip())
+            records = map(json.loads, itertools.islice(lines, skip, None))
+        yield from records
+
+
+class KeyMap:
+    """Естественный ключ → первичный ключ, подгружаемый пачками.
+
+    Переполненная карта очищается целиком: дальше ключи подгружаются
+    заново, а память остаётся ограниченной.
+    """
+
+    def __init__(self, model, field, max_size):
+        self.model = model
+        self.field = field
+        self.max_size = max_size
+        self.known = {}
+
+    def load(self, keys):
+        keys = {key for key in keys if key is not None}
+        missing = keys - self.known.keys()
+        if len(self.known) + len(missing) > self.max_size:
+            self.known.clear()
+            missing = keys
+        for batch in chunks(missing, LOOKUP_BATCH):
+            self.known.update(
+                self.model._base_manager
+                .filter(**{f'{self.field}__in': batch})
+                .values_list(self.field, 'pk')
+            )
+
+    def get(self, key, number, name):
+        try:
+            return self.known[key]
+        except KeyError:
+            raise BadRecord(f'запись {number}: {name} {key!r} не найден')
+
+
+def _text(record, name, number, required=False):
+    value = record.get(name)
+    value = '' if value is None else str(value)
+    if required and not value:
+        raise BadRecord(f'запись {number}: нет поля {name}')
+    return value
+
+
+def _int(record, name, number, required=False):
+    value = record.get(name)
+    if value in (None, ''):
+        if required:
+            raise BadRecord(f'запись {number}: нет поля {name}')
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise BadRecord(f'запись {number}: {name} {value!r} — не число')
+
+
+def _datetime(record, name, number):
+    value = record.get(name)
+    if not value:
+        return timezone.now()
+    moment = parse_datetime(str(value))
+    if moment is None:
+        raise BadRecord(f'запись {number}: {name} {value!r} — не дата')
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class Checkpoint:
+    """Сколько записей каждого файла уже записано в базу."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.done = {}
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as source:
+                self.done = json.load(source)
+
+    def position(self, key):
+        return self.done.get(key, 0)
+
+    def save(self, key, count):
+        self.done[key] = count
+        if not self.path:
+            return
+        # Через временный файл: оборванная запись не портит точку.
+        temporary = f'{self.path}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as target:
+            json.dump(self.done, target)
+            target.flush()
+            os.fsync(target.fileno())
+        os.replace(temporary, self.path)
+
+    def remove(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class Importer:
+    """Потоковая загрузка файлов одного вида через bulk_create."""
+
+    models = {
+        'users': User,
+        'groups': Group,
+        'posts': Post,
+        'comments': Comment,
+        'follows': Follow,
+    }
+    dates = {
+        'users': 'date_joined',
+        'posts': 'pub_date',
+        'comments': 'created',
+    }
+
+    def __init__(self, batch_size=1000, transaction_batches=10,
+                 checkpoint=None, log=None, map_size=100_000):
+        self.batch_size = batch_size
+        self.transaction_rows = batch_size * transaction_batches
+        self.checkpoint = checkpoint or Checkpoint()
+        self.log = log or (lambda message: None)
+        self.users = KeyMap(User, 'username', map_size)
+        self.groups = KeyMap(Group, 'slug', map_size)
+        self.posts = KeyMap(Post, 'pk', map_size)
+        self.unusable_password = make_password(None)
+
+    def run(self, kind, path, fmt=None):
+        """Загружает файл; возвращает число записей и секунды."""
+        fmt = fmt or detect_format(path)
+        model = self.models[kind]
+        key = f'{kind}:{os.path.abspath(path)}'
+        done = self.checkpoint.position(key)
+        if done:
+            self.log(f'{path}: пропуск {done} уже загруженных записей')
+        records = (
+            (number, record) for number, record in enumerate(
+                read_records(path, fmt, skip=done), start=done + 1)
+            if record.get('type') in (None, '', RECORD_TYPES[kind])
+        )
+        build = getattr(self, f'build_{kind}')
+        fields = [model._meta.get_field(name)
+                  for name in [self.dates.get(kind)] if name]
+        imported = 0
+        started = time.perf_counter()
+        try:
+            with explicit_dates(*fields):
+                for chunk in chunks(records, self.transaction_rows):
+                    with transaction.atomic():
+                        for batch in chunks(chunk, self.batch_size):
+                            model._base_manager.bulk_create(
+                                build(batch), ignore_conflicts=True)
+                    # Записи чужого вида пропущены: позиция в файле —
+                    # номер последней записанной записи.
+                    done = chunk[-1][0]
+                    imported += len(chunk)
+                    self.checkpoint.save(key, done)
+                    elapsed = time.perf_counter() - started
+                    self.log(f'{path}: {done} записей, '
+                             f'{imported / max(elapsed, 1e-9):.0f} строк/с')
+        except (ValueError, csv.Error) as error:
+            # Сюда же попадают ошибки разбора JSON и CSV.
+            raise BadRecord(f'{path}: {error}') from error
+        return imported, time.perf_counter() - started
+
+    def build_users(self, batch):
+        return [
+            User(
+                username=_text(record, 'username', number, required=True),
+                first_name=_text(record, 'first_name', number),
+                last_name=_text(record, 'last_name', number),
+                email=_text(record, 'email', number),
+                # Ожидается уже посчитанный хеш; без него войти нельзя.
+                password=(_text(record, 'password', number)
+                          or self.unusable_password),
+                date_joined=_datetime(record, 'date_joined', number),
+            )
+            for number, record in batch
+        ]
+
+    def build_groups(self, batch):
+        return [
+            Group(
+                slug=_text(record, 'slug', number, required=True),
+                title=_text(record, 'title', number, required=True),
+                description=_text(record, 'description', number),
+            )
+            for number, record in batch
+        ]
+
+    def build_posts(self, batch):
+        self.users.load(record.get('author') for _, record in batch)
+        self.groups.load(record.get('group') or None for _, record in batch)
+        posts = []
+        for number, record in batch:
+            group = record.get('group') or None
+            posts.append(Post(
+                pk=_int(record, 'id', number),
+                author_id=self.users.get(record.get('author'), number,
+                                         'автор'),
+                group_id=group and self.groups.get(group, number, 'группа'),
+                text=_text(record, 'text', number, required=True),
+                pub_date=_datetime(record, 'pub_date', number),
+                image=_text(record, 'image', number) or None,
+            ))
+        return posts
+
+    def build_comments(self, batch):
+        post_ids = [_int(record, 'post', number, required=True)
+                    for number, record in batch]
+        self.posts.load(post_ids)
+        self.users.load(record.get('author') for _, record in batch)
+        return [
+            Comment(
+                pk=_int(record, 'id', number),
+                post_id=self.posts.get(post_id, number, 'пост'),
+                author_id=self.users.get(record.get('author'), number,
+                                         'автор'),
+                text=_text(record, 'text', number, required=True),
+                created=_datetime(record, 'created', number),
+            )
+            for post_id, (number, record) in zip(post_ids, batch)
+        ]
+
+    def build_follows(self, batch):
+        self.users.load(itertools.chain.from_iterable(
+            (record.get('user'), record.get('author'))
+            for _, record in batch))
+        follows = []
+        for number, record in batch:
+            user_id = self.users.get(record.get('user'), number,
+                                     'подписчик')
+            author_id = self.users.get(record.get('author'), number, 'автор')
+            # На себя подписаться нельзя и через сайт.
+            if user_id != author_id:
+                follows.append(Follow(user_id=user_id, author_id=author_id))
+        return follows
+
+
+def reset_sequences():
+    """Сдвигает счётчики первичных ключей за id, вставленные явно."""
+    statements = connection.ops.sequence_reset_sql(no_style(), [Post, Comment])
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def import_files(sources, batch_size=1000, transaction_batches=10,
+                 checkpoint_path=None, rebuild=True, log=None):
+    """Загружает файлы [(вид, путь, формат)] в порядке зависимостей.
+
+    Возвращает [(путь, записей, секунд)]. Контрольная точка удаляется
+    только после успешной загрузки всех файлов и пересборки.
+    """
+    checkpoint = Checkpoint(checkpoint_path)
+    importer = Importer(batch_size, transaction_batches, checkpoint, log)
+    report = []
+    for kind, path, fmt in sorted(
+            sources, key=lambda source: KINDS.index(source[0])):
+        report.append((path, *importer.run(kind, path, fmt)))
+    reset_sequences()
+    if rebuild:
+        rebuild_derived(batch_size, log=log)
+    checkpoint.remove()
+    return report
@@ -0,0 +1,300 @@
+"""Поколения (версии) кешированных страниц.
+
+Каждая область — вся лента, группа, автор, пост — имеет в кеше
+версию. Сохранение и удаление объектов меняют версии своих областей,
+а ключи закешированных страниц включают эти версии. Поэтому страницы
+можно хранить долго: после изменения они просто перестают совпадать
+по ключу.
+
+Те же версии служат валидаторами условных GET: ETag страницы — хеш
+версий её областей и того, кто смотрит, а Last-Modified — время самой
+свежей версии. Совпавший запрос получает 304 до запросов к базе и
+рендеринга шаблона.
+"""
+import hashlib
+import time
+from functools import wraps
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.cache import cache_page
+
+from core import holes, replicas, stampede
+
+FEED = 'posts'
+
+
+def group_scope(slug):
+    return f'group:{slug}'
+
+
+def author_scope(username):
+    return f'author:{username}'
+
+
+def author_posts_scope(username):
+    """Только посты автора, без подписок: по ней живут его RSS и Atom."""
+    return f'author_posts:{username}'
+
+
+def post_scope(post_id):
+    return f'post:{post_id}'
+
+
+def related_value(obj, relation, field):
+    """Поле связанного объекта или None, если его строки уже нет.
+
+    При каскадном удалении группы или автора их посты и подписки могут
+    получить post_delete, когда строки группы или автора уже удалены.
+    Области удалённых группы и автора сбрасывают их собственные сигналы.
+    """
+    try:
+        related = getattr(obj, relation)
+    except ObjectDoesNotExist:
+        return None
+    return getattr(related, field) if related is not None else None
+
+
+def post_scopes(post):
+    """Области, на страницах которых виден пост."""
+    scopes = [FEED, post_scope(post.pk)]
+    username = related_value(post, 'author', 'username')
+    if username:
+        scopes += [author_scope(username), author_posts_scope(username)]
+    slug = related_value(post, 'group', 'slug')
+    if slug:
+        scopes.append(group_scope(slug))
+    return scopes
+
+
+def _version_key(scope):
+    return f'version:{scope}'
+
+
+def _new_version():
+    # Случайная, а не счётчик: версия, потерянная при вытеснении из
+    # кеша, не совпадёт со старой, и incr не нужен. После дефиса —
+    # время создания для Last-Modified.
+    return f'{uuid4().hex[:12]}-{int(time.time()):x}'
+
+
+def version_time(version):
+    """Время создания версии в секундах или None для старого формата."""
+    try:
+        return int(version.rpartition('-')[2], 16) if '-' in version else None
+    except ValueError:
+        return None
+
+
+def _fetch_versions(scopes):
+    """Версии областей и новые версии тех, которых в кеше ещё нет."""
+    keys = [_version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    missing = {key: _new_version() for key in keys if key not in versions}
+    versions.update(missing)
+    return [versions[key] for key in keys], missing
+
+
+def _store_versions(missing):
+    # add, а не set: bump, случившийся, пока собиралась страница, не
+    # должен затираться версией, под которой её начали собирать.
+    for key, version in missing.items():
+        cache.add(key, version, settings.VERSION_CACHE_TIMEOUT)
+
+
+def get_versions(scopes):
+    """Текущие версии областей в том же порядке."""
+    versions, missing = _fetch_versions(scopes)
+    _store_versions(missing)
+    return versions
+
+
+def bump(*scopes):
+    """Делает устаревшими все страницы, собранные из этих областей."""
+    cache.set_many(
+        {_version_key(scope): _new_version() for scope in set(scopes)},
+        settings.VERSION_CACHE_TIMEOUT,
+    )
+
+
+def card_keys(posts):
+    """Ключи кеша карточек: id поста плюс версии поста, автора и группы."""
+    scopes = {}
+    for post in posts:
+        scopes[post.pk] = [post_scope(post.pk),
+                           author_scope(post.author.username)]
+        if post.group_id:
+            scopes[post.pk].append(group_scope(post.group.slug))
+    unique = list({scope for pair in scopes.values() for scope in pair})
+    versions = dict(zip(unique, get_versions(unique)))
+    return {
+        pk: ':'.join(['post_card', str(pk),
+                      *(versions[scope] for scope in pair)])
+        for pk, pair in scopes.items()
+    }
+
+
+def _viewer(request):
+    """Часть страницы, зависящая от того, кто смотрит.
+
+    Шапка и переключатель лент зависят от входа на сайт, форма
+    комментария несёт CSRF-токен: его новая cookie после входа тоже
+    должна давать другую страницу.
+    """
+    user = request.user
+    if not user.is_authenticated:
+        return 'anonymous'
+    csrf = request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')
+    return f'{user.pk}:{user.get_username()}:{csrf}'
+
+
+def page_validators(request, key_prefix, versions, per_user=True):
+    """ETag и Last-Modified страницы с данными версиями областей."""
+    viewer = _viewer(request) if per_user else 'anonymous'
+    etag = hashlib.md5(
+        ':'.join([key_prefix, viewer, *versions]).encode()).hexdigest()
+    # Время версий не учитывает того, кто смотрит, поэтому страницам
+    # вошедших пользователей хватает одного ETag.
+    times = [version_time(version) for version in versions]
+    last_modified = None
+    if viewer == 'anonymous' and times and None not in times:
+        last_modified = max(times)
+    return quote_etag(etag), last_modified
+
+
+def _conditional(request, key_prefix, versions, missing, respond,
+                 per_user):
+    response = _validated(request, key_prefix, versions, respond, per_user)
+    # Версии новых областей сохраняются, только если страница нашлась:
+    # адреса несуществующих групп и авторов не должны оставлять их в
+    # кеше и вытеснять оттуда живые страницы.
+    if response.status_code in (200, 304):
+        _store_versions(missing)
+    return response
+
+
+def _validated(request, key_prefix, versions, respond, per_user):
+    if request.method not in ('GET', 'HEAD'):
+        return respond()
+    etag, last_modified = page_validators(request, key_prefix, versions,
+                                          per_user)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = respond()
+        if response.status_code != 200:
+            return response
+    # Прошлая копия страницы не соответствует текущим версиям: с их
+    # валидаторами клиент держал бы её до следующего изменения.
+    if not getattr(response, 'stale', False):
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+    # Версии проверяются на каждом запросе, поэтому браузер и CDN
+    # должны переспрашивать, а не держать страницу по max-age.
+    if 'Expires' in response:
+        del response['Expires']
+    private = per_user and request.user.is_authenticated
+    response['Cache-Control'] = 'private, no-cache' if private else 'no-cache'
+    return response
+
+
+def conditional_page(key_prefix, scopes, per_user=True):
+    """Отвечает 304, если версии областей страницы не менялись.
+
+    scopes получает аргументы представления и возвращает список
+    областей, из которых собрана страница. per_user=False — для
+    страниц, одинаковых для всех: тогда сессия не читается.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            versions, missing = _fetch_versions(scopes(*args, **kwargs))
+            return _conditional(request, key_prefix, versions, missing,
+                                lambda: view(request, *args, **kwargs),
+                                per_user)
+        return wrapper
+    return decorator
+
+
+def versioned_cache_page(timeout, key_prefix, scopes, per_user=True):
+    """cache_page, ключ которого включает версии областей страницы.
+
+    Как conditional_page, отвечает 304 на совпавший условный запрос,
+    не заглядывая в кеш страниц.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            versions, missing = _fetch_versions(scopes(*args, **kwargs))
+            prefix = '.'.join([key_prefix, *versions])
+            cached_view = cache_page(timeout, key_prefix=prefix)(view)
+
+            def respond():
+                with replicas.cache_reads(map(version_time, versions)):
+                    return cached_view(request, *args, **kwargs)
+
+            return _conditional(request, key_prefix, versions, missing,
+                                respond, per_user)
+        return wrapper
+    return decorator
+
+
+def punched_cache_page(timeout, key_prefix, scopes):
+    """Кеш страницы, общий для всех, кто смотрит.
+
+    Страница рисуется с метками вместо частей, зависящих от
+    пользователя (см. core.holes), и хранится под версиями областей.
+    На каждом запросе метки заменяются фрагментами для текущего
+    пользователя. Условные запросы обрабатываются как в
+    conditional_page.
+
+    После смены версий страницу собирает один воркер, остальные
+    отдают её прошлую копию (см. core.stampede).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            versions, missing = _fetch_versions(scopes(*args, **kwargs))
+
+            def respond():
+                path = hashlib.md5(
+                    request.get_full_path().encode()).hexdigest()
+                key = '.'.join(['punched', key_prefix, *versions, path])
+                rendered = {}
+
+                def build():
+                    with holes.punched(request), replicas.cache_reads(
+                            map(version_time, versions)):
+                        response = view(request, *args, **kwargs)
+                    rendered['response'] = response
+                    if response.status_code != 200 or response.streaming:
+                        return None
+                    return response.content.decode(response.charset)
+
+                # Только что писавший должен увидеть свою запись, поэтому
+                # прошлую копию страницы ему не отдаём.
+                body = stampede.get_or_build(
+                    key_prefix, key, build, timeout,
+                    stale_key='.'.join(['punched', key_prefix, path]),
+                    allow_stale=not replicas.pinned(),
+                    on_stale=lambda: rendered.update(stale=True))
+                response = rendered.get('response')
+                if body is None:
+                    return response
+                if response is None:
+                    response = HttpResponse()
+                response.stale = rendered.get('stale', False)
+                response.content = holes.fill(request, body)
+                patch_vary_headers(response, ['Cookie'])
+                return response
+
+            return _conditional(request, key_prefix, versions, missing,
+                                respond, per_user=True)
+        return wrapper
+    return decorator
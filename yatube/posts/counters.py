@@ -0,0 +1,183 @@
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+
+from core import replicas
+from .models import Comment, Follow, Post, User, UserStats
+
+
+def _shift(queryset, field, delta):
+    queryset.update(**{field: Greatest(F(field) + delta, 0)})
+
+
+def change_user_counter(user_id, field, delta):
+    """Сдвигает счётчик пользователя, не опускаясь ниже нуля.
+
+    Строки нет только у пользователей, созданных в обход сигналов
+    (bulk_create, импорт): их чинит rebuild_counters.
+    """
+    _shift(UserStats.objects.filter(user_id=user_id), field, delta)
+
+
+def change_comment_count(post_id, delta):
+    _shift(Post.objects.filter(pk=post_id), 'comment_count', delta)
+
+
+def _shift_many(model, lookup, field, counts):
+    for pk, delta in counts.items():
+        _shift(model.objects.filter(**{lookup: pk}), field, delta)
+
+
+def count_bulk_created(model, objs):
+    """Учитывает в счётчиках строки, вставленные через bulk_create."""
+    if model is Post:
+        _shift_many(UserStats, 'user_id', 'post_count',
+                    Counter(obj.author_id for obj in objs))
+    elif model is Comment:
+        _shift_many(Post, 'pk', 'comment_count',
+                    Counter(obj.post_id for obj in objs))
+    elif model is Follow:
+        _shift_many(UserStats, 'user_id', 'follower_count',
+                    Counter(obj.author_id for obj in objs))
+        _shift_many(UserStats, 'user_id', 'following_count',
+                    Counter(obj.user_id for obj in objs))
+
+
+def stats_for(user):
+    """Счётчики пользователя; недостающая строка пересчитывается на лету."""
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        rebuild_user_counters([user.pk])
+        return UserStats.objects.get(user=user)
+
+
+def _feed_count_key(scope):
+    return f'post_count:{scope}'
+
+
+def estimate_count(queryset, limit):
+    """Число постов выборки, прочитав не больше limit + 1 строк индекса.
+
+    Если постов больше limit, число оценивается по датам: во сколько
+    раз весь срок ленты длиннее срока её последних limit постов.
+    """
+    count = queryset.order_by()[:limit + 1].count()
+    if count <= limit:
+        return count
+    dates = queryset.order_by('-pub_date').values_list('pub_date', flat=True)
+    edge = dates[limit]
+    newest = dates.first()
+    oldest = queryset.order_by('pub_date').values_list(
+        'pub_date', flat=True).first()
+    recent = (newest - edge).total_seconds()
+    if recent <= 0:
+        return limit + 1
+    total = (newest - oldest).total_seconds()
+    return max(limit + 1, round(limit * total / recent))
+
+
+def feed_post_count(scope, queryset):
+    """Число постов области ленты из кеша.
+
+    Промах считается estimate_count, дальше число сдвигают сигналы
+    создания и удаления постов. Срок хранения ограничен, чтобы
+    накопившаяся погрешность оценки со временем уходила.
+    """
+    key = _feed_count_key(scope)
+    count = cache.get(key)
+    if count is None:
+        with replicas.cache_reads():
+            count = estimate_count(queryset,
+                                   settings.PAGINATOR_EXACT_COUNT_LIMIT)
+        cache.set(key, count, settings.PAGE_CACHE_TIMEOUT)
+    return count
+
+
+def correct_feed_post_count(scope, count):
+    """Запоминает точное число постов, найденное на последней странице."""
+    cache.set(_feed_count_key(scope), count, settings.PAGE_CACHE_TIMEOUT)
+
+
+def forget_feed_post_count(scope):
+    """Забывает число постов области, например удалённой группы."""
+    cache.delete(_feed_count_key(scope))
+
+
+def shift_feed_post_counts(scopes, delta):
+    """Сдвигает закешированные числа постов; отсутствующие не создаёт."""
+    for scope in scopes:
+        try:
+            cache.incr(_feed_count_key(scope), delta)
+        except ValueError:
+            pass
+
+
+def _grouped(queryset, field, ids):
+    return dict(
+        queryset.filter(**{f'{field}__in': ids})
+        .order_by()
+        .values_list(field)
+        .annotate(total=Count('pk'))
+    )
+
+
+def rebuild_user_counters(user_ids):
+    """Пересчитывает счётчики пачки пользователей с нуля."""
+    posts = _grouped(Post.objects, 'author_id', user_ids)
+    followers = _grouped(Follow.objects, 'author_id', user_ids)
+    following = _grouped(Follow.objects, 'user_id', user_ids)
+    stats = [
+        UserStats(
+            user_id=user_id,
+            post_count=posts.get(user_id, 0),
+            follower_count=followers.get(user_id, 0),
+            following_count=following.get(user_id, 0),
+        )
+        for user_id in user_ids
+    ]
+    UserStats.objects.bulk_create(stats, ignore_conflicts=True)
+    UserStats.objects.bulk_update(
+        stats, ['post_count', 'follower_count', 'following_count'])
+
+
+def rebuild_comment_counts(post_ids):
+    """Пересчитывает число комментариев пачки постов с нуля."""
+    comments = _grouped(Comment.objects, 'post_id', post_ids)
+    Post.objects.bulk_update(
+        [Post(pk=post_id, comment_count=comments.get(post_id, 0))
+         for post_id in post_ids],
+        ['comment_count'],
+    )
+
+
+def id_batches(queryset, batch_size):
+    """Идёт по первичным ключам пачками, не загружая таблицу в память."""
+    last_id = 0
+    while True:
+        ids = list(
+            queryset.filter(pk__gt=last_id).order_by('pk')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
+
+
+def rebuild_all(batch_size=1000):
+    """Пересчитывает все счётчики; возвращает число пачек."""
+    batches = 0
+    for user_ids in id_batches(User.objects.all(), batch_size):
+        with transaction.atomic():
+            rebuild_user_counters(user_ids)
+        batches += 1
+    for post_ids in id_batches(Post.objects.all(), batch_size):
+        with transaction.atomic():
+            rebuild_comment_counts(post_ids)
+        batches += 1
+    return batches
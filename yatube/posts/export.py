@@ -0,0 +1,167 @@
+"""Потоковая выгрузка постов и комментариев пользователя.
+
+Записи читаются из базы через iterator(chunk_size), поэтому в памяти
+одновременно лежит не больше одной пачки строк, сколько бы постов ни
+было у автора. Формат записей совпадает с тем, что принимает
+import_data: посты ссылаются на группу по slug, комментарии — на пост
+по id. Выгружаются только комментарии к постам самой выгрузки: на
+чужие посты в другой базе ссылаться было бы не на что.
+
+JSONL — одна запись на строку с полем type; import_data берёт из файла
+только записи загружаемого вида, поэтому выгрузка загружается обратно
+как posts=файл comments=файл. Zip содержит posts.jsonl,
+comments.jsonl и картинки постов под их именами в хранилище (поле
+image записи указывает прямо на файл в архиве). Архив пишется в поток
+без перемотки, поэтому отдаётся по частям так же, как JSONL.
+"""
+import io
+import logging
+import zipfile
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Comment, Post
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    'jsonl': 'application/x-ndjson',
+    'zip': 'application/zip',
+}
+# Сколько байт копить перед тем, как отдать кусок ответа.
+STREAM_CHUNK = 64 * 1024
+
+
+def post_records(author):
+    posts = (
+        Post.objects.filter(author=author).order_by('pk')
+        .values_list('pk', 'group__slug', 'text', 'pub_date', 'image')
+        .iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    )
+    for pk, group, text, pub_date, image in posts:
+        yield {
+            'type': 'post',
+            'id': pk,
+            'author': author.username,
+            'group': group,
+            'text': text,
+            'pub_date': pub_date,
+            'image': image or None,
+        }
+
+
+def comment_records(author):
+    comments = (
+        Comment.objects.filter(author=author, post__author=author)
+        .order_by('pk')
+        .values_list('pk', 'post_id', 'text', 'created')
+        .iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    )
+    for pk, post_id, text, created in comments:
+        yield {
+            'type': 'comment',
+            'id': pk,
+            'post': post_id,
+            'author': author.username,
+            'text': text,
+            'created': created,
+        }
+
+
+def jsonl_lines(records):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for record in records:
+        yield (encoder.encode(record) + '\n').encode()
+
+
+def joined(pieces, size=STREAM_CHUNK):
+    """Склеивает мелкие куски в порции около size байт."""
+    buffer = bytearray()
+    for piece in pieces:
+        buffer += piece
+        if len(buffer) >= size:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+def export_jsonl(author):
+    yield from joined(jsonl_lines(post_records(author)))
+    yield from joined(jsonl_lines(comment_records(author)))
+
+
+class StreamBuffer(io.RawIOBase):
+    """Файл только на запись, содержимое которого забирают по частям.
+
+    Перемотки нет, поэтому zipfile пишет размеры записей после данных.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        return len(data)
+
+    def drain(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def _add_image(archive, stream, name):
+    """Копирует картинку в архив; отсутствующий файл пропускается."""
+    try:
+        source = default_storage.open(name, 'rb')
+    except OSError:
+        logger.warning('Картинки %s нет в хранилище, пропущена', name)
+        return
+    info = zipfile.ZipInfo(name)
+    # Картинки уже сжаты, повторное сжатие только тратит процессор.
+    info.compress_type = zipfile.ZIP_STORED
+    with source, archive.open(info, 'w') as target:
+        while True:
+            data = source.read(STREAM_CHUNK)
+            if not data:
+                break
+            target.write(data)
+            yield stream.drain()
+
+
+def export_zip(author):
+    stream = StreamBuffer()
+    entries = [
+        ('posts.jsonl', post_records(author)),
+        ('comments.jsonl', comment_records(author)),
+    ]
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, records in entries:
+            # Размер заранее неизвестен и может превысить 4 ГиБ.
+            with archive.open(name, 'w', force_zip64=True) as target:
+                for chunk in joined(jsonl_lines(records)):
+                    target.write(chunk)
+                    yield stream.drain()
+        # Имена картинок — вторым проходом, а не списком из первого:
+        # так память не зависит от числа постов.
+        images = (
+            Post.objects.filter(author=author).exclude(image='')
+            .exclude(image=None).order_by('pk')
+            .values_list('image', flat=True)
+            .iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+        )
+        for name in images:
+            yield from _add_image(archive, stream, name)
+    yield stream.drain()
+
+
+def export(author, fmt):
+    """Непустые куски выгрузки в формате fmt — jsonl или zip."""
+    chunks = export_zip(author) if fmt == 'zip' else export_jsonl(author)
+    return (chunk for chunk in chunks if chunk)
@@ -0,0 +1,134 @@
+"""RSS и Atom для всей ленты, групп и авторов.
+
+Каждая лента собирается одним запросом: посты берутся вместе с автором
+и группой, а заголовок ленты — из первого поста. Отдельный запрос
+группы или автора нужен, только если постов ещё нет.
+
+Готовый XML лежит в кеше страниц под версиями области ленты, поэтому
+пересобирается только после изменения постов в ней. Те же версии дают
+ETag и Last-Modified: опрашивающие ленту клиенты чаще всего получают 304.
+Лента одинакова для всех, поэтому сессия и пользователь не читаются.
+"""
+from collections import namedtuple
+
+from django.conf import settings
+from django.contrib.syndication.views import Feed
+from django.urls import reverse
+from django.utils.feedgenerator import Atom1Feed
+
+from core.replicas import replica_reads
+from .cache import (FEED, author_posts_scope, group_scope,
+                    versioned_cache_page)
+from .lookups import group_or_404, user_or_404
+from .models import Post
+
+Source = namedtuple('Source', ['owner', 'posts'])
+
+
+def latest(queryset):
+    return list(queryset.for_feed()[:settings.FEED_LENGTH])
+
+
+class PostFeed(Feed):
+    """Общие поля записей ленты."""
+
+    def items(self, obj):
+        return obj.posts
+
+    def item_title(self, post):
+        return str(post.text[:50])
+
+    def item_description(self, post):
+        return post.text
+
+    def item_link(self, post):
+        return reverse('posts:post_detail', args=[post.pk])
+
+    def item_pubdate(self, post):
+        return post.pub_date
+
+    def item_author_name(self, post):
+        return post.author.get_full_name() or post.author.username
+
+    def item_categories(self, post):
+        return [post.group.title] if post.group_id else []
+
+
+class SiteFeed(PostFeed):
+    title = 'Yatube: последние записи'
+    description = 'Новые записи всех авторов'
+
+    def get_object(self, request):
+        return Source(None, latest(Post.objects.all()))
+
+    def link(self):
+        return reverse('posts:index')
+
+
+class GroupFeed(PostFeed):
+    def get_object(self, request, slug):
+        posts = latest(Post.objects.filter(group__slug=slug))
+        group = posts[0].group if posts else group_or_404(slug)
+        return Source(group, posts)
+
+    def title(self, obj):
+        return f'Yatube: {obj.owner.title}'
+
+    def description(self, obj):
+        return obj.owner.description
+
+    def link(self, obj):
+        return reverse('posts:group_list', args=[obj.owner.slug])
+
+
+class AuthorFeed(PostFeed):
+    def get_object(self, request, username):
+        posts = latest(Post.objects.filter(author__username=username))
+        author = posts[0].author if posts else user_or_404(username)
+        return Source(author, posts)
+
+    def title(self, obj):
+        return f'Yatube: записи {obj.owner.username}'
+
+    def description(self, obj):
+        return f'Новые записи пользователя {obj.owner.username}'
+
+    def link(self, obj):
+        return reverse('posts:profile', args=[obj.owner.username])
+
+
+class AtomMixin:
+    feed_type = Atom1Feed
+
+    def subtitle(self, obj):
+        return self._get_dynamic_attr('description', obj)
+
+
+class SiteAtomFeed(AtomMixin, SiteFeed):
+    pass
+
+
+class GroupAtomFeed(AtomMixin, GroupFeed):
+    pass
+
+
+class AuthorAtomFeed(AtomMixin, AuthorFeed):
+    pass
+
+
+def cached(feed, key_prefix, scopes):
+    return replica_reads(versioned_cache_page(
+        settings.PAGE_CACHE_TIMEOUT, key_prefix, scopes,
+        per_user=False)(feed))
+
+
+site_rss = cached(SiteFeed(), 'site_rss', lambda: [FEED])
+site_atom = cached(SiteAtomFeed(), 'site_atom', lambda: [FEED])
+group_rss = cached(GroupFeed(), 'group_rss',
+                   lambda slug: [group_scope(slug)])
+group_atom = cached(GroupAtomFeed(), 'group_atom',
+                    lambda slug: [group_scope(slug)])
+author_rss = cached(AuthorFeed(), 'author_rss',
+                    lambda username: [author_posts_scope(username)])
+author_atom = cached(AuthorAtomFeed(), 'author_atom',
+                     lambda username: [author_posts_scope(username)])
@@ -0,0 +1,35 @@
+"""Фрагменты страниц постов, которые рисуются для каждого пользователя.
+
+См. core.holes: страницы лент, профиля и поста кешируются одни на всех,
+а эти части подставляются на каждом запросе.
+"""
+from core.holes import fragment
+
+from .forms import CommentForm
+from .models import Follow
+
+
+@fragment('switcher', 'posts/includes/switcher.html')
+def switcher(request, index=False, follow=False):
+    return {'index': index, 'follow': follow}
+
+
+@fragment('follow_button', 'posts/includes/follow_button.html')
+def follow_button(request, username):
+    user = request.user
+    following = (
+        user.is_authenticated and user.username != username
+        and Follow.objects.filter(user=user,
+                                  author__username=username).exists()
+    )
+    return {'username': username, 'following': following}
+
+
+@fragment('comment_form', 'posts/includes/comment_form.html')
+def comment_form(request, post_id):
+    return {'post_id': post_id, 'form': CommentForm()}
+
+
+@fragment('post_edit', 'posts/includes/post_edit.html')
+def post_edit(request, post_id, author_id):
+    return {'post_id': post_id, 'can_edit': request.user.pk == author_id}
@@ -0,0 +1,75 @@
+"""Кеш групп по slug и пользователей по username.
+
+Ленты групп, профили и подписки начинают каждый запрос с поиска одной
+и той же редко меняющейся строки. Найденный объект кладётся в кеш,
+ненайденный — отметка о нём на короткий срок, чтобы несуществующий
+адрес тоже не ходил в базу. Записи сбрасывают сигналы сохранения и
+удаления групп и пользователей.
+
+В кеш кладётся только сама строка без связанных объектов: счётчики
+пользователя меняются слишком часто.
+"""
+import copy
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404
+
+from core import replicas
+from .models import Group, User
+
+MISSING = 'missing'
+
+
+def _key(model, value):
+    # Адрес может содержать что угодно, а ключ кеша — нет.
+    digest = hashlib.md5(str(value).encode()).hexdigest()
+    return f'lookup:{model._meta.label_lower}:{digest}'
+
+
+def _bare(obj):
+    """Копия объекта без закешированных связей."""
+    bare = copy.copy(obj)
+    bare._state = copy.copy(obj._state)
+    bare._state.fields_cache = {}
+    return bare
+
+
+def _get_or_404(model, field, value, related=()):
+    key = _key(model, value)
+    obj = cache.get(key)
+    if obj is None:
+        with replicas.cache_reads():
+            obj = (model._default_manager.select_related(*related)
+                   .filter(**{field: value}).first())
+        if obj is None:
+            obj = MISSING
+            cache.set(key, obj, settings.LOOKUP_MISS_TIMEOUT)
+        else:
+            cache.set(key, _bare(obj), settings.LOOKUP_CACHE_TIMEOUT)
+    if obj == MISSING:
+        raise Http404(f'{model._meta.object_name} {value!r} не найден')
+    return obj
+
+
+def group_or_404(slug):
+    return _get_or_404(Group, 'slug', slug)
+
+
+def user_or_404(username, related=()):
+    """Пользователь по username.
+
+    related подгружаются тем же запросом при промахе кеша, но в кеш
+    не попадают.
+    """
+    return _get_or_404(User, 'username', username, related)
+
+
+def forget_group(*slugs):
+    cache.delete_many([_key(Group, slug) for slug in slugs if slug])
+
+
+def forget_user(*usernames):
+    cache.delete_many([_key(User, username)
+                       for username in usernames if username])
@@ -0,0 +1,52 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+from django.core.management.base import BaseCommand
+
+from posts.counters import id_batches
+from posts.models import Post
+from posts.thumbnails import generate, ready_images, setup_worker
+
+
+class Command(BaseCommand):
+    help = ('Нарезает миниатюры для уже загруженных картинок постов '
+            'в несколько процессов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=multiprocessing.cpu_count(),
+            help='Сколько процессов режут картинки; 0 — в этом процессе.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=50,
+            help='Сколько постов отдавать воркеру за раз.',
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Резать и те картинки, миниатюры которых уже готовы.',
+        )
+
+    def batches(self, batch_size, force):
+        posts = Post.objects.exclude(image='')
+        for ids in id_batches(posts, batch_size):
+            items = Post.objects.filter(pk__in=ids).values_list('pk', 'image')
+            ready = set() if force else ready_images(
+                image for _, image in items)
+            items = [(post_id, image) for post_id, image in items
+                     if image not in ready]
+            if items:
+                yield items
+
+    def handle(self, *args, **options):
+        batches = self.batches(options['batch_size'], options['force'])
+        if not options['workers']:
+            done = sum(generate(items) for items in batches)
+        else:
+            with ProcessPoolExecutor(
+                max_workers=options['workers'],
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=setup_worker,
+            ) as pool:
+                done = sum(pool.map(generate, batches))
+        self.stdout.write(self.style.SUCCESS(
+            f'Миниатюры нарезаны для картинок: {done}'))
@@ -0,0 +1,120 @@
+import itertools
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.search import CREATE_TABLE, TABLE, to_match
+
+SYLLABLES = ('ка', 'ро', 'ми', 'ту', 'ле', 'на', 'зо', 'пы', 'ве', 'чу',
+             'да', 'ис', 'ом', 'ул', 'сте', 'при', 'гра', 'бло', 'ня', 'фе')
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает поиск через FTS5 с LIKE-сканированием, которым '
+            'ищет админка, на синтетической базе из миллионов постов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2_000_000,
+                            help='Сколько постов сгенерировать.')
+        parser.add_argument('--words', type=int, default=30,
+                            help='Слов в одном посте.')
+        parser.add_argument('--vocabulary', type=int, default=50_000,
+                            help='Размер словаря; частоты слов по Ципфу.')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Сколько раз повторять каждый запрос.')
+        parser.add_argument('--path',
+                            help='Файл базы; уже заполненный используется '
+                                 'повторно. По умолчанию временный.')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def vocabulary(self, size, rnd):
+        words = set()
+        while len(words) < size:
+            words.add(''.join(rnd.choices(SYLLABLES, k=rnd.randint(2, 4))))
+        return sorted(words, key=lambda word: rnd.random())
+
+    def fill(self, db, options, words):
+        rnd = random.Random(options['seed'])
+        cum_weights = list(itertools.accumulate(
+            1 / rank for rank in range(1, len(words) + 1)))
+        db.execute('CREATE TABLE posts (id INTEGER PRIMARY KEY, text TEXT)')
+        db.execute(CREATE_TABLE)
+        batch = 10_000
+        for start in range(1, options['rows'] + 1, batch):
+            stop = min(start + batch, options['rows'] + 1)
+            rows = [
+                (pk, ' '.join(rnd.choices(words, cum_weights=cum_weights,
+                                          k=options['words'])))
+                for pk in range(start, stop)
+            ]
+            db.executemany('INSERT INTO posts VALUES (?, ?)', rows)
+            db.executemany(
+                f'INSERT INTO {TABLE} (rowid, text) VALUES (?, ?)', rows)
+            db.commit()
+        db.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('optimize')")
+        db.commit()
+
+    def timed(self, db, sql, params, repeat):
+        times = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            db.execute(sql, params).fetchall()
+            times.append((time.perf_counter() - started) * 1000)
+        return statistics.median(times)
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['seed'])
+        words = self.vocabulary(options['vocabulary'], rnd)
+        queries = {
+            'частое слово': words[5],
+            'среднее слово': words[len(words) // 10],
+            'редкое слово': words[-1],
+            'два слова': f'{words[20]} {words[300]}',
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            path = options['path'] or os.path.join(tmp, 'search.sqlite3')
+            reuse = os.path.exists(path)
+            db = sqlite3.connect(path)
+            if not reuse:
+                started = time.perf_counter()
+                self.fill(db, options, words)
+                self.stdout.write(
+                    f'{options["rows"]} постов сгенерировано за '
+                    f'{time.perf_counter() - started:.1f} с')
+            for name, query in queries.items():
+                self.stdout.write(f'{name} «{query}»:')
+                for label, ms in self.compare(db, query, options['repeat']):
+                    self.stdout.write(f'  {label:<32} {ms:9.1f} мс')
+            db.close()
+
+    def compare(self, db, query, repeat):
+        terms = query.split()
+        like = ' AND '.join(['text LIKE ?'] * len(terms))
+        like_params = [f'%{term}%' for term in terms]
+        match = f'{TABLE} MATCH ?'
+        # Так ищет icontains: подстрока каждого слова, проход таблицы до
+        # первых 11 строк по убыванию id, а админка ещё и считает все
+        # совпадения полным проходом. FTS5 ранжирует все совпадения,
+        # поэтому на самых частых словах первая страница LIKE без
+        # ранжирования может оказаться быстрее.
+        cases = [
+            ('LIKE, первая страница',
+             f'SELECT id FROM posts WHERE {like} ORDER BY id DESC LIMIT 11',
+             like_params),
+            ('LIKE, число совпадений',
+             f'SELECT COUNT(*) FROM posts WHERE {like}', like_params),
+            ('FTS5, первая страница по bm25',
+             f'SELECT rowid, bm25({TABLE}) AS score FROM {TABLE} '
+             f'WHERE {match} ORDER BY score, rowid LIMIT 11',
+             [to_match(query)]),
+            ('FTS5, число совпадений',
+             f'SELECT COUNT(*) FROM {TABLE} WHERE {match}',
+             [to_match(query)]),
+        ]
+        for label, sql, params in cases:
+            yield label, self.timed(db, sql, params, repeat)
@@ -0,0 +1,235 @@
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from contextlib import ExitStack
+from importlib import import_module
+from io import BytesIO
+from urllib.parse import urlencode
+
+import django
+from django.conf import settings
+from django.contrib.auth import (BACKEND_SESSION_KEY, HASH_SESSION_KEY,
+                                 SESSION_KEY)
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+from django.urls import reverse
+
+from posts import urls as post_urls
+from posts.models import Comment, Follow, Group, Post, User
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, round(share * (len(ordered) - 1)))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = ('Прогоняет все адреса posts/urls.py через WSGI-приложение и '
+            'выдаёт JSON с p50/p95/p99 задержки, числом запросов к БД и '
+            'пиковой памятью на адрес.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Замеров на адрес.')
+        parser.add_argument('--warmup', type=int, default=3,
+                            help='Прогревочных проходов без замеров.')
+        parser.add_argument(
+            '--cache', choices=('warm', 'cold'), default='warm',
+            help='cold очищает кеш перед каждым запросом.')
+        parser.add_argument('--anonymous', action='store_true',
+                            help='Ходить без входа на сайт.')
+        parser.add_argument('--output', help='Куда записать JSON.')
+        parser.add_argument(
+            '--compare',
+            help='JSON прошлого прогона: изменения выводятся в stderr.')
+
+    def samples(self):
+        """Типичные объекты: самые популярные автор, группа и пост."""
+        author = (User.objects.order_by('-stats__follower_count')
+                  .filter(posts__isnull=False).first())
+        group = (Group.objects.filter(posts__isnull=False)
+                 .order_by('-pk').first())
+        post = Post.objects.order_by('-comment_count', '-pk').first()
+        reader = User.objects.order_by('-stats__following_count').first()
+        if not (author and post and reader):
+            raise CommandError('База пуста: сначала запустите seed_data.')
+        return {
+            'username': author.username,
+            'slug': group.slug if group else None,
+            'post_id': post.pk,
+            'reader': reader,
+            'word': post.text.split()[0] if post.text.split() else 'а',
+        }
+
+    def urls(self, samples):
+        """Адреса всех представлений приложения posts, по порядку."""
+        urls = []
+        for pattern in post_urls.urlpatterns:
+            names = list(pattern.pattern.converters)
+            if any(samples.get(name) is None for name in names):
+                continue
+            path = reverse(f'{post_urls.app_name}:{pattern.name}', kwargs={
+                name: samples[name] for name in names})
+            query = ''
+            if pattern.name == 'search':
+                query = urlencode({'q': samples['word']})
+            urls.append((pattern.name, path, query))
+        return urls
+
+    def session_cookie(self, user):
+        # Сессия — как после входа через сайт: тот же движок сессий и
+        # тот же бэкенд, иначе запросы пойдут как анонимные.
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.save()
+        return f'{settings.SESSION_COOKIE_NAME}={session.session_key}'
+
+    def call(self, app, path, query, cookie):
+        environ = {
+            'REQUEST_METHOD': 'GET',
+            'PATH_INFO': path,
+            'QUERY_STRING': query,
+            'SERVER_NAME': 'localhost',
+            'SERVER_PORT': '80',
+            'HTTP_HOST': 'localhost',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': BytesIO(),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': False,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        if cookie:
+            environ['HTTP_COOKIE'] = cookie
+        status = []
+        result = app(environ, lambda code, headers, exc=None:
+                     status.append(code))
+        try:
+            b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return int(status[0].split()[0])
+
+    def measure(self, app, urls, cookie, options):
+        counters = {name: QueryCounter() for name, _, _ in urls}
+        timings = {name: [] for name, _, _ in urls}
+        statuses = {}
+        for round_number in range(options['warmup'] + options['requests']):
+            # По кругу, а не подряд: follow и unfollow чередуются, и
+            # каждый адрес видит кеш, прогретый остальными.
+            for name, path, query in urls:
+                if options['cache'] == 'cold':
+                    cache.clear()
+                counter = counters[name]
+                measured = round_number >= options['warmup']
+                with ExitStack() as stack:
+                    if measured:
+                        for connection in connections.all():
+                            stack.enter_context(
+                                connection.execute_wrapper(counter))
+                    started = time.perf_counter()
+                    statuses[name] = self.call(app, path, query, cookie)
+                    elapsed = (time.perf_counter() - started) * 1000
+                if measured:
+                    timings[name].append(elapsed)
+        return timings, counters, statuses
+
+    def peak_memory(self, app, urls, cookie, options):
+        """Отдельный проход под tracemalloc: он сильно замедляет код."""
+        peaks = {}
+        tracemalloc.start()
+        try:
+            for name, path, query in urls:
+                if options['cache'] == 'cold':
+                    cache.clear()
+                current, _ = tracemalloc.get_traced_memory()
+                tracemalloc.reset_peak()
+                self.call(app, path, query, cookie)
+                peaks[name] = tracemalloc.get_traced_memory()[1] - current
+        finally:
+            tracemalloc.stop()
+        return peaks
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests должен быть положительным.')
+        samples = self.samples()
+        urls = self.urls(samples)
+        cookie = (None if options['anonymous']
+                  else self.session_cookie(samples['reader']))
+        app = get_wsgi_application()
+        timings, counters, statuses = self.measure(app, urls, cookie, options)
+        peaks = self.peak_memory(app, urls, cookie, options)
+        results = {}
+        for name, path, query in urls:
+            values = timings[name]
+            results[name] = {
+                'path': path + (f'?{query}' if query else ''),
+                'status': statuses[name],
+                'p50_ms': round(percentile(values, 0.50), 3),
+                'p95_ms': round(percentile(values, 0.95), 3),
+                'p99_ms': round(percentile(values, 0.99), 3),
+                'mean_ms': round(statistics.fmean(values), 3),
+                'queries': round(counters[name].count / len(values), 2),
+                'peak_memory_kib': round(peaks[name] / 1024, 1),
+            }
+        report = {
+            'meta': {
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'debug': settings.DEBUG,
+                'requests': options['requests'],
+                'cache': options['cache'],
+                'anonymous': options['anonymous'],
+                'rows': {
+                    'users': User.objects.count(),
+                    'posts': Post.objects.count(),
+                    'comments': Comment.objects.count(),
+                    'follows': Follow.objects.count(),
+                },
+            },
+            'results': results,
+        }
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                output.write(text)
+        else:
+            self.stdout.write(text)
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def compare(self, path, results):
+        with open(path, encoding='utf-8') as previous_file:
+            previous = json.load(previous_file)['results']
+        for name, result in results.items():
+            before = previous.get(name)
+            if not before:
+                continue
+            changes = []
+            for metric in ('p50_ms', 'p95_ms', 'p99_ms', 'queries'):
+                old, new = before[metric], result[metric]
+                delta = (new - old) / old * 100 if old else 0
+                changes.append(f'{metric} {old} → {new} ({delta:+.0f}%)')
+            self.stderr.write(f'{name}: ' + ', '.join(changes))
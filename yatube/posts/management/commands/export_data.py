@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.export import FORMATS, export
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = ('Потоково выгружает посты и комментарии пользователя в JSONL '
+            'или в zip вместе с картинками постов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--format', choices=list(FORMATS),
+                            default='jsonl')
+        parser.add_argument(
+            '--output',
+            help='Файл выгрузки; JSONL без него пишется в stdout.')
+
+    def handle(self, *args, **options):
+        if options['format'] == 'zip' and not options['output']:
+            raise CommandError('Для zip укажите --output.')
+        try:
+            author = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(
+                f'Пользователь {options["username"]!r} не найден.')
+        chunks = export(author, options['format'])
+        if options['output']:
+            with open(options['output'], 'wb') as target:
+                for chunk in chunks:
+                    target.write(chunk)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk.decode(), ending='')
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.bulk import FORMATS, KINDS, BadRecord, import_files
+
+
+class Command(BaseCommand):
+    help = ('Потоково загружает пользователей, группы, посты, комментарии '
+            'и подписки из JSONL или CSV пачками через bulk_create. '
+            'Файлы задаются как вид=путь, например posts=posts.jsonl.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('sources', nargs='+', metavar='вид=путь',
+                            help=f'Вид данных: {", ".join(KINDS)}.')
+        parser.add_argument(
+            '--format', choices=FORMATS,
+            help='Формат всех файлов; по умолчанию по расширению.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Строк в одном bulk_create.')
+        parser.add_argument('--transaction-batches', type=int, default=10,
+                            help='Пачек bulk_create в одной транзакции.')
+        parser.add_argument(
+            '--checkpoint',
+            help='Файл контрольной точки: с ним прерванную загрузку '
+                 'можно продолжить тем же вызовом.')
+        parser.add_argument(
+            '--no-rebuild', action='store_true',
+            help='Не пересобирать счётчики, ленты и поисковый индекс.')
+
+    def parse_sources(self, values, fmt):
+        sources = []
+        for value in values:
+            kind, _, path = value.partition('=')
+            if kind not in KINDS or not path:
+                raise CommandError(
+                    f'Ожидается вид=путь с видом из {", ".join(KINDS)}: '
+                    f'{value!r}')
+            sources.append((kind, path, fmt))
+        return sources
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['transaction_batches'] < 1:
+            raise CommandError('Размеры пачек должны быть положительными.')
+        sources = self.parse_sources(options['sources'], options['format'])
+        log = self.stdout.write if options['verbosity'] > 1 else None
+        try:
+            report = import_files(
+                sources,
+                batch_size=options['batch_size'],
+                transaction_batches=options['transaction_batches'],
+                checkpoint_path=options['checkpoint'],
+                rebuild=not options['no_rebuild'],
+                log=log,
+            )
+        except (BadRecord, OSError) as error:
+            hint = (' Исправьте данные и повторите вызов: загрузка '
+                    'продолжится с контрольной точки.'
+                    if options['checkpoint'] else '')
+            raise CommandError(f'{error}.{hint}')
+        for path, rows, elapsed in report:
+            self.stdout.write(f'{path}: {rows} записей за {elapsed:.1f} с '
+                              f'({rows / max(elapsed, 1e-9):.0f} строк/с)')
+        self.stdout.write(self.style.SUCCESS('Загрузка завершена'))
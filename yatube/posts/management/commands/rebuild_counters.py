@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import rebuild_all
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает с нуля счётчики постов, комментариев '
+            'и подписок пачками.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько строк пересчитывать в одной транзакции.',
+        )
+
+    def handle(self, *args, **options):
+        batches = rebuild_all(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Счётчики пересчитаны, пачек: {batches}'))
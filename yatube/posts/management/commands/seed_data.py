@@ -0,0 +1,195 @@
+import itertools
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from posts.bulk import chunks, explicit_dates, rebuild_derived
+from posts.models import Comment, Follow, Group, Post, User
+
+WORDS = (
+    'день', 'ночь', 'утро', 'город', 'дом', 'река', 'лес', 'море', 'солнце',
+    'дорога', 'книга', 'музыка', 'кино', 'друг', 'работа', 'время', 'жизнь',
+    'история', 'мир', 'слово', 'кофе', 'чай', 'кот', 'собака', 'зима',
+    'лето', 'осень', 'весна', 'поезд', 'сад', 'песня', 'вопрос', 'ответ',
+    'идея', 'проект', 'код', 'тест', 'ошибка', 'праздник', 'путешествие',
+)
+
+
+def zipf_weights(count, skew):
+    """Накопленные веса степенного закона для random.choices."""
+    return list(itertools.accumulate(
+        1 / rank ** skew for rank in range(1, count + 1)))
+
+
+class Command(BaseCommand):
+    help = ('Наполняет базу синтетическими данными с реалистичным '
+            'перекосом: степенное распределение подписчиков и постов '
+            'на автора, всплески комментариев под популярными постами.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100_000)
+        parser.add_argument('--posts', type=int, default=1_000_000)
+        parser.add_argument('--groups', type=int, default=50)
+        parser.add_argument('--comments', type=int, default=500_000)
+        parser.add_argument(
+            '--follows-per-user', type=float, default=20,
+            help='Среднее число подписок; распределено по Парето.')
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Показатель степенного закона популярности авторов.')
+        parser.add_argument('--days', type=int, default=365,
+                            help='За сколько дней распределить посты.')
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--prefix', default='seed',
+                            help='Префикс имён пользователей и групп.')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def timed(self, name, rows, started):
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'{name}: {rows} за {elapsed:.1f} с '
+                          f'({rows / max(elapsed, 1e-9):.0f} строк/с)')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(
+                f'Пользователи с префиксом {prefix!r} уже есть; '
+                'укажите другой --prefix.')
+        self.rnd = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.options = options
+
+        user_ids = self.seed_users(prefix)
+        group_ids = self.seed_groups(prefix)
+        # Одна и та же перестановка: популярные авторы и пишут больше.
+        popular = user_ids[:]
+        self.rnd.shuffle(popular)
+        popularity = zipf_weights(len(popular), options['skew'])
+        posts = self.seed_posts(popular, popularity, group_ids)
+        self.seed_follows(user_ids, popular, popularity)
+        self.seed_comments(user_ids, posts)
+
+        started = time.perf_counter()
+        rebuild_derived(self.batch_size, log=self.stdout.write)
+        self.timed('Производные данные', len(posts), started)
+        self.stdout.write(self.style.SUCCESS('Готово'))
+
+    def seed_users(self, prefix):
+        started = time.perf_counter()
+        password = make_password(None)
+        users = (
+            User(username=f'{prefix}{i}', first_name=f'Автор {i}',
+                 password=password)
+            for i in range(self.options['users'])
+        )
+        for chunk in chunks(users, self.batch_size):
+            User.objects.bulk_create(chunk)
+        ids = list(User.objects.filter(username__startswith=prefix)
+                   .order_by('pk').values_list('pk', flat=True))
+        self.timed('Пользователи', len(ids), started)
+        return ids
+
+    def seed_groups(self, prefix):
+        Group.objects.bulk_create(
+            Group(title=f'Группа {i}', slug=f'{prefix}-group-{i}',
+                  description=f'Описание группы {i}')
+            for i in range(self.options['groups'])
+        )
+        return list(Group.objects.filter(slug__startswith=f'{prefix}-group-')
+                    .values_list('pk', flat=True))
+
+    def text(self):
+        return ' '.join(self.rnd.choices(WORDS, k=self.rnd.randint(5, 40)))
+
+    def seed_posts(self, popular, popularity, group_ids):
+        """Посты по возрастанию даты; возвращает [(id, pub_date)]."""
+        started = time.perf_counter()
+        count = self.options['posts']
+        start = timezone.now() - timedelta(days=self.options['days'])
+        step = timedelta(days=self.options['days']) / max(count, 1)
+        group_weights = zipf_weights(len(group_ids), 1.0)
+        last_id = Post.objects.order_by('-pk').values_list(
+            'pk', flat=True).first() or 0
+
+        def make(i):
+            group_id = None
+            if group_ids and self.rnd.random() < 0.6:
+                group_id = self.rnd.choices(
+                    group_ids, cum_weights=group_weights)[0]
+            return Post(
+                author_id=self.rnd.choices(popular,
+                                           cum_weights=popularity)[0],
+                group_id=group_id,
+                text=self.text(),
+                pub_date=start + step * i,
+            )
+
+        pub_date = Post._meta.get_field('pub_date')
+        with explicit_dates(pub_date):
+            for chunk in chunks(map(make, range(count)), self.batch_size):
+                # Счётчики пересчитываются в конце одним проходом, поэтому
+                # обходим CountedQuerySet через базовый менеджер.
+                Post._base_manager.bulk_create(chunk)
+        posts = list(Post.objects.filter(pk__gt=last_id).order_by('pk')
+                     .values_list('pk', 'pub_date'))
+        self.timed('Посты', len(posts), started)
+        return posts
+
+    def seed_follows(self, user_ids, popular, popularity):
+        started = time.perf_counter()
+        mean = self.options['follows_per_user']
+        # У Парето с alpha=1.5 среднее 3, отсюда масштаб mean / 3.
+        cap = min(len(popular) - 1, 5000)
+
+        def follows():
+            for user_id in user_ids:
+                wanted = int(self.rnd.paretovariate(1.5) * mean / 3)
+                authors = set(self.rnd.choices(
+                    popular, cum_weights=popularity, k=min(wanted, cap)))
+                authors.discard(user_id)
+                for author_id in authors:
+                    yield Follow(user_id=user_id, author_id=author_id)
+
+        total = 0
+        for chunk in chunks(follows(), self.batch_size):
+            Follow.objects.bulk_create(chunk, ignore_conflicts=True)
+            total += len(chunk)
+        self.timed('Подписки', total, started)
+
+    def seed_comments(self, user_ids, posts):
+        """Комментарии всплесками: пачка за короткое время под одним
+        популярным постом."""
+        started = time.perf_counter()
+        if not posts:
+            return
+        hot = posts[:]
+        self.rnd.shuffle(hot)
+        hot_weights = zipf_weights(len(hot), 1.0)
+        remaining = self.options['comments']
+
+        def comments():
+            nonlocal remaining
+            while remaining > 0:
+                post_id, pub_date = self.rnd.choices(
+                    hot, cum_weights=hot_weights)[0]
+                burst = min(remaining, int(self.rnd.paretovariate(1.2)) * 3)
+                moment = pub_date + timedelta(
+                    minutes=self.rnd.expovariate(1 / 120))
+                for _ in range(burst):
+                    moment += timedelta(seconds=self.rnd.expovariate(1 / 60))
+                    yield Comment(post_id=post_id,
+                                  author_id=self.rnd.choice(user_ids),
+                                  text=self.text(), created=moment)
+                remaining -= burst
+
+        total = 0
+        created = Comment._meta.get_field('created')
+        with explicit_dates(created):
+            for chunk in chunks(comments(), self.batch_size):
+                Comment._base_manager.bulk_create(chunk)
+                total += len(chunk)
+        self.timed('Комментарии', total, started)
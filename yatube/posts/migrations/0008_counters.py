@@ -0,0 +1,63 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:00
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Follow = apps.get_model('posts', 'Follow')
+    UserStats = apps.get_model('posts', 'UserStats')
+
+    def grouped(queryset, field):
+        return dict(queryset.order_by().values_list(field)
+                    .annotate(total=Count('pk')))
+
+    posts = grouped(Post.objects, 'author_id')
+    followers = grouped(Follow.objects, 'author_id')
+    following = grouped(Follow.objects, 'user_id')
+    UserStats.objects.bulk_create(
+        (UserStats(user_id=user_id,
+                   post_count=posts.get(user_id, 0),
+                   follower_count=followers.get(user_id, 0),
+                   following_count=following.get(user_id, 0))
+         for user_id in User.objects.values_list('pk', flat=True)),
+        batch_size=500,
+    )
+    comments = grouped(Comment.objects, 'post_id')
+    for post_id, total in comments.items():
+        Post.objects.filter(pk=post_id).update(comment_count=total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0007_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('post_count', models.PositiveIntegerField(default=0, verbose_name='Постов')),
+                ('follower_count', models.PositiveIntegerField(default=0, verbose_name='Подписчиков')),
+                ('following_count', models.PositiveIntegerField(default=0, verbose_name='Подписок')),
+            ],
+            options={
+                'verbose_name': 'Счётчики пользователя',
+                'verbose_name_plural': 'Счётчики пользователей',
+            },
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Комментариев'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
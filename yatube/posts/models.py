@@ -4,6 +4,36 @@ from django.contrib.auth import get_user_model
 User = get_user_model()
 
 
+class CountedQuerySet(models.QuerySet):
+    """QuerySet, чей bulk_create не обходит денормализованные счётчики.
+
+    С ignore_conflicts неизвестно, какие строки вставлены, поэтому
+    счётчики не трогаются: их пересчитывает rebuild_counters.
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        if not kwargs.get('ignore_conflicts'):
+            from .counters import count_bulk_created
+            count_bulk_created(self.model, objs)
+        return objs
+
+
+class PostQuerySet(CountedQuerySet):
+    """Выборки постов с заранее подтянутыми связями для шаблонов."""
+
+    def for_feed(self):
+        """Для карточек лент: автор и группа одним JOIN."""
+        return self.select_related('author', 'group')
+
+    def for_detail(self):
+        """Для страницы поста: счётчики автора и группа.
+
+        Комментарии читаются отдельно постранично, см. utils.comment_page.
+        """
+        return self.select_related('author__stats', 'group')
+
+
 class Group(models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(unique=True)
@@ -45,11 +75,26 @@ class Post(models.Model):
         blank=True,
         null=True,
     )
+    comment_count = models.PositiveIntegerField(
+        verbose_name='Комментариев',
+        default=0,
+        editable=False,
+    )
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
         ordering = ["-pub_date"]
+        indexes = [
+            models.Index(fields=['pub_date'],
+                         name='post_pub_date_idx'),
+            models.Index(fields=['author', 'pub_date'],
+                         name='post_author_pub_date_idx'),
+            models.Index(fields=['group', 'pub_date'],
+                         name='post_group_pub_date_idx'),
+        ]
 
     def __str__(self):
         return str(self.text[:15])
@@ -78,6 +123,15 @@ class Comment(models.Model):
         auto_now_add=True,
     )
 
+    objects = CountedQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['created']
+        indexes = [
+            models.Index(fields=['post', 'created'],
+                         name='comment_post_created_idx'),
+        ]
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -93,5 +147,83 @@ class Follow(models.Model):
         related_name='following',
     )
 
+    objects = CountedQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'author'],
+                                    name='unique_follow'),
+        ]
+
     def __str__(self):
         return f'Подписка {self.user} на {self.auth}'
+
+
+class UserStats(models.Model):
+    """Денормализованные счётчики пользователя.
+
+    Поддерживаются сигналами при создании и удалении постов и подписок,
+    пересчитываются командой rebuild_counters.
+    """
+    user = models.OneToOneField(
+        User,
+        verbose_name='Пользователь',
+        primary_key=True,
+        on_delete=models.CASCADE,
+        related_name='stats',
+    )
+    post_count = models.PositiveIntegerField(
+        verbose_name='Постов',
+        default=0,
+    )
+    follower_count = models.PositiveIntegerField(
+        verbose_name='Подписчиков',
+        default=0,
+    )
+    following_count = models.PositiveIntegerField(
+        verbose_name='Подписок',
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = 'Счётчики пользователя'
+        verbose_name_plural = 'Счётчики пользователей'
+
+    def __str__(self):
+        return f'Счётчики {self.user_id}'
+
+
+class TimelineEntry(models.Model):
+    """Запись материализованной ленты подписок пользователя.
+
+    Заполняется при публикации поста (fan-out on write), поэтому
+    follow_index читает готовый список вместо join через Follow.
+    """
+    user = models.ForeignKey(
+        User,
+        verbose_name='Читатель',
+        on_delete=models.CASCADE,
+        related_name='timeline',
+    )
+    post = models.ForeignKey(
+        Post,
+        verbose_name='Пост',
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации',
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        ordering = ['-pub_date']
+        unique_together = ('user', 'post')
+        indexes = [
+            models.Index(fields=['user', 'pub_date', 'post'],
+                         name='timeline_user_pub_date_idx'),
+        ]
+
+    def __str__(self):
+        return f'Пост {self.post_id} в ленте {self.user_id}'
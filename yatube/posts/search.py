@@ -0,0 +1,148 @@
+"""Полнотекстовый поиск по постам через SQLite FTS5.
+
+Текст постов дублируется в виртуальную таблицу posts_post_fts с rowid,
+равным id поста. Сигналы обновляют её при сохранении и удалении
+поста. Посты, вставленные через bulk_create, сигналов не вызывают:
+их подхватывает команда rebuild_search_index.
+"""
+import re
+
+from django.db import connection, transaction
+from django.db.models.expressions import RawSQL
+
+from .counters import id_batches
+from .models import Post
+from .utils import BACKWARD, FORWARD, CursorPage, decode_cursor, encode_cursor
+
+TABLE = 'posts_post_fts'
+CREATE_TABLE = (
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5('
+    "text, tokenize = 'unicode61 remove_diacritics 2')"
+)
+TOKEN = re.compile(r'\w+')
+
+
+def to_match(query):
+    """Запрос пользователя в выражение MATCH: все слова, по префиксу.
+
+    Каждое слово берётся в кавычки, поэтому операторы FTS5 из ввода не
+    исполняются. Для запроса без слов возвращает None.
+    """
+    words = TOKEN.findall(query.lower())
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def index_posts(rows):
+    """Добавляет или обновляет в индексе посты [(id, text), ...]."""
+    rows = list(rows)
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {TABLE} WHERE rowid = %s',
+                           [(pk,) for pk, _ in rows])
+        cursor.executemany(
+            f'INSERT INTO {TABLE} (rowid, text) VALUES (%s, %s)', rows)
+
+
+def unindex_posts(post_ids):
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {TABLE} WHERE rowid = %s',
+                           [(pk,) for pk in post_ids])
+
+
+def rebuild(batch_size=1000):
+    """Заново наполняет индекс, читая посты пачками; возвращает их число."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+    total = 0
+    for ids in id_batches(Post.objects.all(), batch_size):
+        rows = Post.objects.filter(pk__in=ids).values_list('pk', 'text')
+        with transaction.atomic():
+            index_posts(rows)
+        total += len(ids)
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('optimize')")
+    return total
+
+
+def matching(queryset, query):
+    """Фильтрует queryset постов по индексу, без ранжирования."""
+    match = to_match(query)
+    if match is None:
+        return queryset.none()
+    return queryset.filter(pk__in=RawSQL(
+        f'SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s', [match]))
+
+
+class SearchPaginator:
+    """Курсорная выдача поиска по (релевантность, id).
+
+    bm25 у лучших совпадений меньше, поэтому страницы идут по
+    возрастанию оценки; id разводит посты с одинаковой оценкой.
+    """
+
+    def __init__(self, query, per_page, group=None, author=None):
+        self.match = to_match(query)
+        self.per_page = per_page
+        self.group = group
+        self.author = author
+
+    def _hits(self, values, direction):
+        sql = [
+            f'SELECT hits.score, hits.id FROM ('
+            f'SELECT rowid AS id, bm25({TABLE}) AS score FROM {TABLE} '
+            f'WHERE {TABLE} MATCH %s) hits',
+        ]
+        params = [self.match]
+        where = []
+        if self.group is not None or self.author is not None:
+            sql.append(f'JOIN {Post._meta.db_table} post '
+                       'ON post.id = hits.id')
+        if self.group is not None:
+            where.append('post.group_id = %s')
+            params.append(self.group.pk)
+        if self.author is not None:
+            where.append('post.author_id = %s')
+            params.append(self.author.pk)
+        if values is not None:
+            sign = '>' if direction == FORWARD else '<'
+            where.append(f'(hits.score {sign} %s OR '
+                         f'(hits.score = %s AND hits.id {sign} %s))')
+            score, pk = values
+            params += [score, score, pk]
+        if where:
+            sql.append('WHERE ' + ' AND '.join(where))
+        order = 'ASC' if direction == FORWARD else 'DESC'
+        sql.append(f'ORDER BY hits.score {order}, hits.id {order} LIMIT %s')
+        params.append(self.per_page + 1)
+        with connection.cursor() as cursor:
+            cursor.execute(' '.join(sql), params)
+            return cursor.fetchall()
+
+    def get_page(self, cursor=None):
+        if self.match is None:
+            return CursorPage([])
+        converters = [float, Post._meta.pk.to_python]
+        decoded = decode_cursor(cursor, converters) if cursor else None
+        direction, values = decoded or (FORWARD, None)
+        hits = self._hits(values, direction)
+        has_more = len(hits) > self.per_page
+        hits = hits[:self.per_page]
+        if direction == BACKWARD:
+            hits.reverse()
+        if not hits:
+            return CursorPage([])
+        posts = Post.objects.for_feed().in_bulk([pk for _, pk in hits])
+        # Пост мог быть удалён в обход сигналов: такой hit пропускаем.
+        rows = [posts[pk] for _, pk in hits if pk in posts]
+        if direction == FORWARD:
+            has_next, has_previous = has_more, values is not None
+        else:
+            has_next, has_previous = True, has_more
+        return CursorPage(
+            rows,
+            next_cursor=(encode_cursor(FORWARD, list(hits[-1]))
+                         if has_next else None),
+            previous_cursor=(encode_cursor(BACKWARD, list(hits[0]))
+                             if has_previous else None),
+        )
@@ -0,0 +1,205 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import cache, counters, lookups, search, timeline
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def post_created(sender, instance, created, **kwargs):
+    if created:
+        counters.change_user_counter(instance.author_id, 'post_count', 1)
+        timeline.fan_out(instance)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.change_user_counter(instance.author_id, 'post_count', -1)
+    timeline.forget_post(instance)
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, **kwargs):
+    if created:
+        counters.change_comment_count(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.change_comment_count(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        counters.change_user_counter(instance.author_id, 'follower_count', 1)
+        counters.change_user_counter(instance.user_id, 'following_count', 1)
+        timeline.backfill(instance.user_id, instance.author_id)
+        timeline.leave_fan_out(instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.change_user_counter(instance.author_id, 'follower_count', -1)
+    counters.change_user_counter(instance.user_id, 'following_count', -1)
+    timeline.prune(instance.user_id, instance.author_id)
+    timeline.rejoin_fan_out(instance.author_id)
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_group(sender, instance, raw=False, **kwargs):
+    instance._old_group_slug = None
+    if instance.pk and not raw:
+        instance._old_group_slug = (
+            Post.objects.filter(pk=instance.pk)
+            .values_list('group__slug', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Post)
+def invalidate_post_pages(sender, instance, **kwargs):
+    scopes = cache.post_scopes(instance)
+    old_slug = getattr(instance, '_old_group_slug', None)
+    if old_slug:
+        scopes.append(cache.group_scope(old_slug))
+    cache.bump(*scopes)
+
+
+@receiver(post_save, sender=Post)
+def count_feed_posts(sender, instance, created, **kwargs):
+    slug = instance.group.slug if instance.group_id else None
+    if created:
+        scopes = [cache.FEED] + ([cache.group_scope(slug)] if slug else [])
+        counters.shift_feed_post_counts(scopes, 1)
+        return
+    old_slug = getattr(instance, '_old_group_slug', None)
+    if old_slug != slug:
+        if old_slug:
+            counters.shift_feed_post_counts([cache.group_scope(old_slug)], -1)
+        if slug:
+            counters.shift_feed_post_counts([cache.group_scope(slug)], 1)
+
+
+@receiver(post_delete, sender=Post)
+def uncount_feed_posts(sender, instance, **kwargs):
+    scopes = [cache.FEED]
+    slug = cache.related_value(instance, 'group', 'slug')
+    if slug:
+        scopes.append(cache.group_scope(slug))
+    counters.shift_feed_post_counts(scopes, -1)
+
+
+@receiver(post_delete, sender=Post)
+def invalidate_deleted_post_pages(sender, instance, **kwargs):
+    cache.bump(*cache.post_scopes(instance))
+
+
+@receiver(pre_save, sender=Group)
+def remember_group_slug(sender, instance, raw=False, **kwargs):
+    instance._old_slug = None
+    if instance.pk and not raw:
+        instance._old_slug = (
+            Group.objects.filter(pk=instance.pk)
+            .values_list('slug', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group_pages(sender, instance, **kwargs):
+    scopes = [cache.FEED, cache.group_scope(instance.slug)]
+    old_slug = getattr(instance, '_old_slug', None)
+    if old_slug:
+        scopes.append(cache.group_scope(old_slug))
+    cache.bump(*scopes)
+
+
+@receiver(post_delete, sender=Group)
+def forget_group_post_count(sender, instance, **kwargs):
+    counters.forget_feed_post_count(cache.group_scope(instance.slug))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def forget_group_lookup(sender, instance, **kwargs):
+    lookups.forget_group(instance.slug, getattr(instance, '_old_slug', None))
+
+
+# Поля пользователя, которые видны в карточках постов и лентах.
+NAME_FIELDS = ('username', 'first_name', 'last_name')
+
+
+@receiver(pre_save, sender=User)
+def remember_username(sender, instance, raw=False, update_fields=None,
+                      **kwargs):
+    # Вход сохраняет только last_login: лишний запрос ему не нужен.
+    instance._old_names = None
+    if (instance.pk and not raw
+            and (update_fields is None
+                 or set(update_fields) & set(NAME_FIELDS))):
+        instance._old_names = (
+            User.objects.filter(pk=instance.pk)
+            .values_list(*NAME_FIELDS).first()
+        )
+    instance._old_username = (instance._old_names[0]
+                              if instance._old_names else None)
+
+
+@receiver(post_save, sender=User)
+def invalidate_renamed_user_pages(sender, instance, **kwargs):
+    old = getattr(instance, '_old_names', None)
+    if old is None or old == tuple(getattr(instance, field)
+                                   for field in NAME_FIELDS):
+        return
+    slugs = (
+        Post.objects.filter(author=instance, group__isnull=False)
+        .order_by().values_list('group__slug', flat=True).distinct()
+    )
+    cache.bump(cache.FEED,
+               *(scope(username) for username in (old[0], instance.username)
+                 for scope in (cache.author_scope, cache.author_posts_scope)),
+               *(cache.group_scope(slug) for slug in slugs))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_user_lookup(sender, instance, **kwargs):
+    lookups.forget_user(instance.username,
+                        getattr(instance, '_old_username', None))
+
+
+@receiver(post_delete, sender=User)
+def invalidate_deleted_user_pages(sender, instance, **kwargs):
+    cache.bump(cache.FEED, cache.author_scope(instance.username),
+               cache.author_posts_scope(instance.username))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_pages(sender, instance, **kwargs):
+    cache.bump(cache.post_scope(instance.post_id))
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow_pages(sender, instance, **kwargs):
+    usernames = [cache.related_value(instance, 'author', 'username'),
+                 cache.related_value(instance, 'user', 'username')]
+    cache.bump(*(cache.author_scope(username)
+                 for username in usernames if username))
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, **kwargs):
+    search.index_posts([(instance.pk, instance.text)])
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    search.unindex_posts([instance.pk])
@@ -0,0 +1,7 @@
+from django import template
+
+from posts.utils import page_window
+
+register = template.Library()
+
+register.simple_tag(page_window)
@@ -0,0 +1,38 @@
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from posts.cache import card_keys
+
+register = template.Library()
+
+CARD_TEMPLATE = 'posts/includes/post_card.html'
+
+
+class PostCards:
+    """HTML карточек страницы: одним get_many из кеша, остальное рендером."""
+
+    def __init__(self, posts):
+        self.keys = card_keys(posts)
+        self.html = cache.get_many(self.keys.values())
+
+    def render(self, post):
+        key = self.keys.get(post.pk)
+        html = self.html.get(key)
+        if html is None:
+            html = render_to_string(CARD_TEMPLATE, {'post': post})
+            if key:
+                cache.set(key, html, settings.PAGE_CACHE_TIMEOUT)
+        return mark_safe(html)
+
+
+@register.simple_tag
+def post_cards(posts):
+    return PostCards(list(posts))
+
+
+@register.simple_tag
+def post_card(cards, post):
+    return cards.render(post)
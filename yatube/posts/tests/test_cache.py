@@ -0,0 +1,271 @@
+import hashlib
+
+from django.conf import settings
+from django.test import TestCase, Client
+from django.urls import reverse
+from django.core.cache import cache
+
+from .. import cache as page_cache
+from ..models import Comment, Follow, Group, Post, User
+
+
+class PostCardCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.user,
+            group=cls.group,
+            text='Тестовый пост',
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def get_index(self):
+        # Сбрасываем только страницу, чтобы проверить кеш карточек.
+        page_cache.bump(page_cache.FEED)
+        return self.guest_client.get(reverse('posts:index'))
+
+    def test_card_is_served_from_cache(self):
+        '''Карточка поста берётся из кеша, пока пост не изменён'''
+        self.get_index()
+        Post.objects.filter(pk=self.post.pk).update(text='Обход сигналов')
+        self.assertContains(self.get_index(), 'Тестовый пост')
+
+    def test_card_invalidated_by_post_and_group(self):
+        '''Карточка пересобирается при изменении поста или его группы'''
+        self.get_index()
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Новый текст'
+        post.save()
+        self.assertContains(self.get_index(), 'Новый текст')
+        group = Group.objects.get(pk=self.group.pk)
+        group.slug = 'new-slug'
+        group.save()
+        self.assertContains(self.get_index(), '/group/new-slug/')
+
+    def test_author_rename_refreshes_pages(self):
+        '''Новое имя автора сразу видно в лентах и ведёт на его профиль'''
+        pages = [reverse('posts:index'),
+                 reverse('posts:group_list', args=[self.group.slug])]
+        for page in pages:
+            self.guest_client.get(page)
+        user = User.objects.get(pk=self.user.pk)
+        user.username = 'renamed'
+        user.first_name = 'Новое имя'
+        user.save()
+        for page in pages:
+            with self.subTest(page=page):
+                response = self.guest_client.get(page)
+                self.assertContains(response, 'Новое имя')
+                self.assertContains(response, '/profile/renamed/')
+                self.assertNotContains(response, '/profile/auth/')
+
+    def test_login_keeps_pages_cached(self):
+        '''Вход пользователя не сбрасывает страницы с его постами'''
+        url = reverse('posts:index')
+        self.guest_client.get(url)
+        Client().force_login(self.user)
+        with self.assertNumQueries(0):
+            self.guest_client.get(url)
+
+    def test_cards_shared_between_feeds(self):
+        '''Одна и та же карточка используется во всех лентах'''
+        self.get_index()
+        Post.objects.filter(pk=self.post.pk).update(text='Обход сигналов')
+        response = self.guest_client.get(
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}))
+        self.assertContains(response, 'Тестовый пост')
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='group',
+                                         description='Описание')
+        cls.post = Post.objects.create(author=cls.author, group=cls.group,
+                                       text='Тестовый пост')
+        cls.urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', args=[cls.group.slug]),
+            reverse('posts:profile', args=[cls.author.username]),
+            reverse('posts:post_detail', args=[cls.post.pk]),
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def revalidate(self, client, url, response):
+        return client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_unchanged_pages_answer_not_modified(self):
+        '''Неизменившаяся страница отвечает 304 без запросов к базе'''
+        for url in self.urls[:3]:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertEqual(response['Cache-Control'], 'no-cache')
+                with self.assertNumQueries(0):
+                    again = self.revalidate(self.guest_client, url,
+                                            response)
+                self.assertEqual(again.status_code, 304)
+                self.assertIsNone(again.context)
+                since = self.guest_client.get(
+                    url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+                self.assertEqual(since.status_code, 304)
+        response = self.guest_client.get(self.urls[3])
+        # Страница поста узнаёт автора и группу одним запросом.
+        with self.assertNumQueries(1):
+            again = self.revalidate(self.guest_client, self.urls[3],
+                                    response)
+        self.assertEqual(again.status_code, 304)
+
+    def test_changes_make_pages_modified(self):
+        '''Новый пост и комментарий меняют валидаторы страниц'''
+        responses = {url: self.guest_client.get(url) for url in self.urls}
+        Post.objects.create(author=self.author, group=self.group,
+                            text='Ещё пост')
+        for url, response in responses.items():
+            with self.subTest(url=url):
+                again = self.revalidate(self.guest_client, url, response)
+                self.assertEqual(again.status_code, 200)
+        detail = self.guest_client.get(self.urls[3])
+        Comment.objects.create(post=self.post, author=self.reader,
+                               text='Комментарий')
+        self.assertEqual(self.revalidate(
+            self.guest_client, self.urls[3], detail).status_code, 200)
+
+    def test_per_user_parts_stay_correct(self):
+        '''ETag учитывает пользователя, подписку и CSRF-cookie'''
+        profile = self.urls[2]
+        guest = self.guest_client.get(profile)
+        self.assertEqual(self.revalidate(
+            self.reader_client, profile, guest).status_code, 200)
+        response = self.reader_client.get(profile)
+        self.assertNotIn('Last-Modified', response)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertEqual(self.revalidate(
+            self.reader_client, profile, response).status_code, 304)
+        Follow.objects.create(user=self.reader, author=self.author)
+        again = self.revalidate(self.reader_client, profile, response)
+        self.assertContains(again, 'Отписаться')
+
+        detail = self.reader_client.get(self.urls[3])
+        self.reader_client.cookies[settings.CSRF_COOKIE_NAME] = 'rotated'
+        self.assertEqual(self.revalidate(
+            self.reader_client, self.urls[3], detail).status_code, 200)
+
+    def test_missing_pages_store_no_versions(self):
+        '''Адреса несуществующих объектов не оставляют версий в кеше'''
+        missing = {
+            reverse('posts:profile', args=['ghost']):
+                page_cache.author_scope('ghost'),
+            reverse('posts:group_list', args=['ghost']):
+                page_cache.group_scope('ghost'),
+            reverse('posts:post_detail', args=[self.post.pk + 100]):
+                page_cache.post_scope(self.post.pk + 100),
+            reverse('posts:author_rss', args=['ghost']):
+                page_cache.author_posts_scope('ghost'),
+        }
+        for url, scope in missing.items():
+            with self.subTest(url=url):
+                self.assertEqual(self.guest_client.get(url).status_code,
+                                 404)
+                self.assertIsNone(cache.get(f'version:{scope}'))
+        self.guest_client.get(self.urls[2])
+        self.assertIsNotNone(cache.get(
+            f'version:{page_cache.author_scope(self.author.username)}'))
+
+
+class PunchedPageCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='group',
+                                         description='Описание')
+        cls.post = Post.objects.create(author=cls.author, group=cls.group,
+                                       text='Тестовый пост')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        # Сессия и пользователь берутся из кеша.
+        cls.budgets = {
+            reverse('posts:index'): 0,
+            reverse('posts:group_list', args=[cls.group.slug]): 0,
+            # Кнопка подписки проверяет подписку.
+            reverse('posts:profile', args=[cls.author.username]): 1,
+            # Области страницы поста читаются до кеша.
+            reverse('posts:post_detail', args=[cls.post.pk]): 1,
+        }
+
+    def setUp(self):
+        cache.clear()
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_logged_in_users_share_cached_pages(self):
+        '''Вошедшие пользователи получают страницу из общего кеша'''
+        self.reader_client.get(reverse('about:author'))
+        for url, budget in self.budgets.items():
+            with self.subTest(url=url):
+                self.author_client.get(url)
+                with self.assertNumQueries(budget):
+                    response = self.reader_client.get(url)
+                self.assertContains(response, 'Тестовый пост')
+                self.assertContains(response, 'Пользователь: reader')
+                self.assertNotContains(response, 'Пользователь: author')
+                self.assertNotContains(response, '<!--hole:')
+
+    def test_fragments_drawn_for_each_user(self):
+        '''Кнопки и форма на общей странице свои у каждого пользователя'''
+        profile = reverse('posts:profile', args=[self.author.username])
+        self.assertContains(self.author_client.get(profile), 'Выгрузить')
+        response = self.reader_client.get(profile)
+        self.assertContains(response, 'Отписаться')
+        self.assertNotContains(response, 'Выгрузить')
+        self.assertContains(Client().get(profile), 'Подписаться')
+
+        detail = reverse('posts:post_detail', args=[self.post.pk])
+        self.assertContains(self.author_client.get(detail),
+                            'Редактировать запись')
+        response = self.reader_client.get(detail)
+        self.assertNotContains(response, 'Редактировать запись')
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        self.assertNotContains(Client().get(detail), 'csrfmiddlewaretoken')
+
+    def test_stale_copy_has_no_validators(self):
+        '''Прошлая копия страницы отдаётся без ETag и Last-Modified'''
+        url = reverse('posts:index')
+        self.reader_client.get(url)
+        Post.objects.create(author=self.author, text='Свежий пост')
+        # Страницу с новыми версиями будто бы собирает другой воркер.
+        versions = page_cache.get_versions([page_cache.FEED])
+        path = hashlib.md5(url.encode()).hexdigest()
+        lock = 'lock:' + '.'.join(['punched', 'index_page', *versions, path])
+        cache.add(lock, 1)
+        guest = Client()
+        stale = guest.get(url)
+        self.assertNotContains(stale, 'Свежий пост')
+        self.assertNotIn('ETag', stale)
+        self.assertNotIn('Last-Modified', stale)
+        self.assertEqual(stale['Cache-Control'], 'no-cache')
+        cache.delete(lock)
+        fresh = guest.get(url)
+        self.assertContains(fresh, 'Свежий пост')
+        again = guest.get(url, HTTP_IF_NONE_MATCH=fresh['ETag'])
+        self.assertEqual(again.status_code, 304)
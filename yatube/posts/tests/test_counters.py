@@ -0,0 +1,71 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, Client
+from django.urls import reverse
+
+from ..models import Comment, Follow, Post, User, UserStats
+
+
+class CountersTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_counters_follow_creates_and_deletes(self):
+        '''Счётчики меняются при создании и удалении объектов'''
+        post = Post.objects.create(author=self.author, text='Пост')
+        comment = Comment.objects.create(post=post, author=self.reader,
+                                         text='Комментарий')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(self.stats(self.author).post_count, 1)
+        self.assertEqual(self.stats(self.author).follower_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+
+        comment.delete()
+        follow.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 0)
+        self.assertEqual(self.stats(self.author).follower_count, 0)
+        self.assertEqual(self.stats(self.reader).following_count, 0)
+        post.delete()
+        self.assertEqual(self.stats(self.author).post_count, 0)
+
+    def test_bulk_create_updates_counters(self):
+        '''bulk_create тоже учитывается в счётчиках'''
+        Post.objects.bulk_create(
+            Post(author=self.author, text=f'Пост {i}') for i in range(3))
+        Follow.objects.bulk_create(
+            [Follow(user=self.reader, author=self.author)])
+        self.assertEqual(self.stats(self.author).post_count, 3)
+        self.assertEqual(self.stats(self.author).follower_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+
+    def test_rebuild_counters_command(self):
+        '''rebuild_counters пересчитывает счётчики с нуля'''
+        Post.objects.bulk_create(
+            Post(author=self.author, text=f'Пост {i}') for i in range(3))
+        UserStats.objects.filter(user=self.reader).delete()
+        Follow.objects.bulk_create(
+            [Follow(user=self.reader, author=self.author)],
+            ignore_conflicts=True)
+        call_command('rebuild_counters', batch_size=1, stdout=StringIO())
+        self.assertEqual(self.stats(self.author).post_count, 3)
+        self.assertEqual(self.stats(self.author).follower_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+
+    def test_profile_reads_stored_counter(self):
+        '''Профиль берёт число постов из счётчика, а не из COUNT(*)'''
+        Post.objects.create(author=self.author, text='Пост')
+        UserStats.objects.filter(user=self.author).update(post_count=7)
+        response = Client().get(reverse('posts:profile',
+                                        kwargs={'username': 'author'}))
+        self.assertEqual(response.context['post_count'], 7)
+        self.assertEqual(response.context['page_obj'].paginator.count, 7)
@@ -0,0 +1,98 @@
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..models import Follow, Group, Post, User
+
+
+class FeedTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(title='Коты', slug='cats',
+                                         description='Про котов')
+        cls.other_group = Group.objects.create(title='Псы', slug='dogs',
+                                               description='Про псов')
+        for i in range(3):
+            cls.post = Post.objects.create(author=cls.author,
+                                           group=cls.group,
+                                           text=f'Пост про кота {i}')
+        cls.feeds = {
+            'posts:site_rss': [],
+            'posts:site_atom': [],
+            'posts:group_rss': ['cats'],
+            'posts:group_atom': ['cats'],
+            'posts:author_rss': ['author'],
+            'posts:author_atom': ['author'],
+        }
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def test_feeds_built_with_one_query_and_cached(self):
+        '''Лента собирается одним запросом и дальше берётся из кеша'''
+        for name, args in self.feeds.items():
+            url = reverse(name, args=args)
+            with self.subTest(url=url):
+                with self.assertNumQueries(1):
+                    response = self.client.get(url)
+                kind = 'atom' if name.endswith('atom') else 'rss'
+                self.assertIn(kind, response['Content-Type'])
+                self.assertContains(response, 'Пост про кота 2')
+                self.assertContains(response, reverse(
+                    'posts:post_detail', args=[self.post.pk]))
+                with self.assertNumQueries(0):
+                    self.assertContains(self.client.get(url),
+                                        'Пост про кота 2')
+                with self.assertNumQueries(0):
+                    again = self.client.get(
+                        url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(again.status_code, 304)
+
+    def test_feed_refreshed_by_post_in_its_scope(self):
+        '''Лента меняется только после нового поста в ней'''
+        url = reverse('posts:group_rss', args=['cats'])
+        response = self.client.get(url)
+        Post.objects.create(author=self.author, group=self.other_group,
+                            text='Пост про пса')
+        self.assertEqual(self.client.get(
+            url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        Post.objects.create(author=self.author, group=self.group,
+                            text='Новый пост про кота')
+        again = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertContains(again, 'Новый пост про кота')
+
+    def test_author_feed_kept_on_follow(self):
+        '''Подписка на автора не пересобирает его ленту'''
+        reader = User.objects.create_user(username='reader')
+        for name in ('posts:author_rss', 'posts:author_atom'):
+            url = reverse(name, args=['author'])
+            response = self.client.get(url)
+            Follow.objects.create(user=reader, author=self.author)
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(
+                    url, HTTP_IF_NONE_MATCH=response['ETag']).status_code,
+                    304)
+            Follow.objects.filter(user=reader).delete()
+            self.assertEqual(self.client.get(
+                url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_empty_and_missing_scopes(self):
+        '''Пустая группа отдаёт пустую ленту, несуществующая — 404'''
+        response = self.client.get(reverse('posts:group_atom',
+                                           args=['dogs']))
+        self.assertContains(response, 'Псы')
+        self.assertEqual(self.client.get(
+            reverse('posts:group_rss', args=['missing'])).status_code, 404)
+        self.assertEqual(self.client.get(
+            reverse('posts:author_rss', args=['nobody'])).status_code, 404)
+
+    def test_pages_link_their_feeds(self):
+        '''Страницы лент ссылаются на свои RSS и Atom'''
+        response = self.client.get(reverse('posts:group_list',
+                                           args=['cats']))
+        self.assertContains(response, reverse('posts:group_rss',
+                                              args=['cats']))
+        self.assertContains(response, 'application/atom+xml')
@@ -0,0 +1,126 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from ..bulk import KeyMap
+from ..models import Comment, Follow, Group, Post, TimelineEntry, User
+
+
+class ImportDataTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+
+    def write_jsonl(self, name, records):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'w', encoding='utf-8') as target:
+            for record in records:
+                target.write(json.dumps(record, ensure_ascii=False) + '\n')
+        return path
+
+    def write_csv(self, name, fields, rows):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'w', encoding='utf-8', newline='') as target:
+            writer = csv.writer(target)
+            writer.writerow(fields)
+            writer.writerows(rows)
+        return path
+
+    def load(self, *sources, **options):
+        call_command('import_data', *sources, stdout=StringIO(), **options)
+
+    def test_import_resolves_keys_and_rebuilds(self):
+        '''Импорт связывает записи по ключам и пересобирает производное'''
+        User.objects.create_user(username='old')
+        users = self.write_csv('users.csv', ['username', 'first_name'], [
+            ['anna', 'Анна'], ['boris', 'Борис'], ['old', 'Дубль']])
+        groups = self.write_jsonl('groups.jsonl', [
+            {'slug': 'cats', 'title': 'Кошки', 'description': 'Про кошек'}])
+        posts = self.write_jsonl('posts.jsonl', [
+            {'id': 500, 'author': 'anna', 'group': 'cats',
+             'text': 'Кошка спит', 'pub_date': '2020-01-02T03:04:05'},
+            {'id': 501, 'author': 'old', 'text': 'Без группы'},
+        ])
+        comments = self.write_csv(
+            'comments.csv', ['post', 'author', 'text', 'created'],
+            [['500', 'boris', 'Мило', '2020-01-03 10:00:00']])
+        follows = self.write_jsonl('follows.jsonl', [
+            {'user': 'boris', 'author': 'anna'},
+            {'user': 'anna', 'author': 'anna'},
+        ])
+        # Порядок аргументов не важен: виды грузятся по зависимостям.
+        self.load(f'follows={follows}', f'comments={comments}',
+                  f'posts={posts}', f'groups={groups}', f'users={users}',
+                  batch_size=1)
+
+        self.assertEqual(User.objects.get(username='old').first_name, '')
+        post = Post.objects.get(pk=500)
+        self.assertEqual(post.author.username, 'anna')
+        self.assertEqual(post.group.slug, 'cats')
+        self.assertEqual(post.pub_date.year, 2020)
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(Comment.objects.get().author.username, 'boris')
+        self.assertEqual(Follow.objects.count(), 1)
+        boris = User.objects.get(username='boris')
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=boris, post=post).exists())
+        self.assertEqual(post.author.stats.follower_count, 1)
+        self.assertFalse(boris.has_usable_password())
+        new = Post.objects.create(author=boris, text='После импорта')
+        self.assertGreater(new.pk, 501)
+
+    def test_resume_from_checkpoint(self):
+        '''После ошибки загрузка продолжается без повторов'''
+        User.objects.create_user(username='anna')
+        post = Post.objects.create(author=User.objects.get(), text='Пост')
+        rows = [[post.pk, 'anna', f'Комментарий {i}'] for i in range(5)]
+        rows[3][1] = 'nobody'
+        comments = self.write_csv('comments.csv',
+                                  ['post', 'author', 'text'], rows)
+        checkpoint = os.path.join(self.tmp, 'import.json')
+        options = {'batch_size': 2, 'transaction_batches': 1,
+                   'checkpoint': checkpoint}
+        with self.assertRaisesMessage(CommandError, "'nobody' не найден"):
+            self.load(f'comments={comments}', **options)
+        # Первая транзакция записана, вторая с ошибкой откатилась.
+        self.assertEqual(Comment.objects.count(), 2)
+
+        rows[3][1] = 'anna'
+        self.write_csv('comments.csv', ['post', 'author', 'text'], rows)
+        self.load(f'comments={comments}', **options)
+        self.assertEqual(
+            list(Comment.objects.values_list('text', flat=True)),
+            [f'Комментарий {i}' for i in range(5)])
+        self.assertFalse(os.path.exists(checkpoint))
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 5)
+
+    def test_unknown_reference_is_reported(self):
+        '''Ссылка на несуществующую группу — понятная ошибка'''
+        User.objects.create_user(username='anna')
+        posts = self.write_jsonl('posts.jsonl', [
+            {'author': 'anna', 'group': 'missing', 'text': 'Текст'}])
+        with self.assertRaisesMessage(CommandError, "группа 'missing'"):
+            self.load(f'posts={posts}')
+        self.assertFalse(Group.objects.exists())
+        self.assertFalse(Post.objects.exists())
+
+    def test_key_map_stays_bounded(self):
+        '''Переполненная карта ключей очищается и подгружает пачку заново'''
+        for name in 'abc':
+            User.objects.create_user(username=name)
+        users = KeyMap(User, 'username', max_size=2)
+        users.load(['a', 'b'])
+        users.load(['b', 'c'])
+        self.assertEqual(set(users.known), {'b', 'c'})
+        self.assertEqual(users.get('b', 1, 'автор'),
+                         User.objects.get(username='b').pk)
@@ -0,0 +1,63 @@
+from django.core.cache import cache
+from django.http import Http404
+from django.test import TestCase
+
+from ..lookups import group_or_404, user_or_404
+from ..models import Group, User, UserStats
+
+
+class LookupCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.group = Group.objects.create(title='Коты', slug='cats',
+                                         description='Про котов')
+        cls.user = User.objects.create_user(username='author')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_found_objects_served_from_cache(self):
+        '''Группа и пользователь читаются из базы один раз'''
+        group_or_404('cats')
+        user_or_404('author')
+        with self.assertNumQueries(0):
+            self.assertEqual(group_or_404('cats'), self.group)
+            self.assertEqual(user_or_404('author'), self.user)
+
+    def test_missing_cached_until_created(self):
+        '''Ненайденный адрес кешируется, пока объект не создан'''
+        for _ in range(2):
+            with self.assertRaises(Http404):
+                group_or_404('dogs')
+        with self.assertNumQueries(0), self.assertRaises(Http404):
+            group_or_404('dogs')
+        group = Group.objects.create(title='Псы', slug='dogs',
+                                     description='Про псов')
+        self.assertEqual(group_or_404('dogs'), group)
+
+    def test_rename_and_delete_invalidate(self):
+        '''Переименование и удаление сбрасывают старый адрес'''
+        group_or_404('cats')
+        user_or_404('author')
+        group = Group.objects.get(pk=self.group.pk)
+        group.slug = 'kittens'
+        group.save()
+        user = User.objects.get(pk=self.user.pk)
+        user.username = 'writer'
+        user.save()
+        with self.assertRaises(Http404):
+            group_or_404('cats')
+        with self.assertRaises(Http404):
+            user_or_404('author')
+        self.assertEqual(user_or_404('writer').pk, self.user.pk)
+        group.delete()
+        with self.assertRaises(Http404):
+            group_or_404('kittens')
+
+    def test_related_rows_not_cached(self):
+        '''Счётчики пользователя не берутся из кеша поиска'''
+        user_or_404('author', related=['stats'])
+        UserStats.objects.filter(user=self.user).update(post_count=5)
+        with self.assertNumQueries(1):
+            self.assertEqual(user_or_404('author').stats.post_count, 5)
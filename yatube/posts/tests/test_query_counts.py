@@ -0,0 +1,87 @@
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post, User
+
+# Сколько запросов к БД может сделать страница. Сессия и пользователь
+# берутся из кеша и запросов не стоят. Число не должно зависеть от
+# количества постов, авторов и комментариев: превышение значит, что
+# появился N+1.
+# Страница поста сначала одним запросом узнаёт автора и группу для
+# проверки условного GET. Лента подписок без кеша отдельно выбирает id
+# первых страниц и затем сами посты по ним.
+QUERY_BUDGETS = {
+    'posts:index': 3,
+    'posts:group_list': 4,
+    'posts:profile': 4,
+    'posts:post_detail': 4,
+    'posts:follow_index': 5,
+    'posts:search': 3,
+}
+
+
+class QueryBudgetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='group',
+                                         description='Описание')
+        cls.authors = [User.objects.create_user(username=f'author{i}')
+                       for i in range(4)]
+        for author in cls.authors:
+            Follow.objects.create(user=cls.reader, author=author)
+        cls.post = cls.add_posts(12)
+
+    @classmethod
+    def add_posts(cls, count):
+        for i in range(count):
+            post = Post.objects.create(
+                author=cls.authors[i % len(cls.authors)],
+                group=cls.group if i % 2 else None,
+                text=f'Запись {i}',
+                image=f'posts/{i}.gif' if i % 3 else None,
+            )
+            Comment.objects.create(post=post, text='Комментарий',
+                                   author=cls.authors[-1 - i % 3])
+        return post
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def urls(self):
+        return {
+            'posts:index': reverse('posts:index'),
+            'posts:group_list': reverse('posts:group_list',
+                                        args=[self.group.slug]),
+            'posts:profile': reverse('posts:profile',
+                                     args=[self.authors[1].username]),
+            'posts:post_detail': reverse('posts:post_detail',
+                                         args=[self.post.pk]),
+            'posts:follow_index': reverse('posts:follow_index'),
+            'posts:search': reverse('posts:search') + '?q=запись',
+        }
+
+    def check_budgets(self):
+        for name, url in self.urls().items():
+            with self.subTest(view=name):
+                # Страницы и карточки кешируются: меряем полную сборку.
+                # Сессия и пользователь возвращаются в кеш заранее.
+                cache.clear()
+                self.client.get(reverse('about:author'))
+                with self.assertNumQueries(QUERY_BUDGETS[name]):
+                    self.client.get(url)
+
+    def test_query_budgets(self):
+        '''Страницы укладываются в бюджет запросов'''
+        self.check_budgets()
+
+    def test_budgets_do_not_grow_with_data(self):
+        '''Бюджет не зависит от числа постов и комментариев'''
+        for i in range(5):
+            Comment.objects.create(post=self.post, text='Ещё комментарий',
+                                   author=self.authors[i % 4])
+        self.post = self.add_posts(12)
+        self.check_budgets()
@@ -0,0 +1,69 @@
+from django.db import connection
+from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.core.cache import cache
+
+from ..models import Comment, Follow, Group, Post, User
+
+
+class QueryPlanTests(TestCase):
+    '''Запросы лент и страницы поста используют индексы
+    и не сортируют во временном B-дереве'''
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        Follow.objects.create(user=cls.reader, author=cls.user)
+        cls.post = Post.objects.create(
+            author=cls.user,
+            group=cls.group,
+            text='Тестовый пост',
+        )
+        Comment.objects.create(post=cls.post, author=cls.reader,
+                               text='Комментарий')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+
+    def feed_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url)
+        return [query['sql'] for query in context.captured_queries
+                if query['sql'].startswith('SELECT')
+                and '"posts_' in query['sql']]
+
+    def test_view_queries_use_indexes(self):
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': 'auth'}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            reverse('posts:follow_index'),
+            reverse('posts:site_rss'),
+            reverse('posts:group_rss', kwargs={'slug': self.group.slug}),
+            reverse('posts:author_rss', kwargs={'username': 'auth'}),
+        ]
+        for url in urls:
+            queries = self.feed_queries(url)
+            self.assertTrue(queries, url)
+            for sql in queries:
+                plan = self.explain(sql)
+                with self.subTest(url=url, sql=sql, plan=plan):
+                    for step in plan:
+                        self.assertNotIn('TEMP B-TREE', step)
+                        if step.startswith('SCAN posts_'):
+                            self.assertIn('INDEX', step)
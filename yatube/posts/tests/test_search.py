@@ -0,0 +1,102 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from ..models import Group, Post, User
+from ..search import TABLE
+from ..utils import FORWARD, encode_cursor
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.other = User.objects.create_user(username='other')
+        cls.group = Group.objects.create(title='Группа', slug='group',
+                                         description='Описание')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def search(self, **params):
+        response = self.client.get(reverse('posts:search'), params)
+        return [post.text for post in response.context['page_obj']]
+
+    def test_index_follows_saves_and_deletes(self):
+        '''Индекс обновляется при создании, правке и удалении поста'''
+        post = Post.objects.create(author=self.author, text='Кошка спит')
+        self.assertEqual(self.search(q='кошка'), ['Кошка спит'])
+        post.text = 'Собака спит'
+        post.save()
+        self.assertEqual(self.search(q='кошка'), [])
+        self.assertEqual(self.search(q='собак'), ['Собака спит'])
+        post.delete()
+        self.assertEqual(self.search(q='собака'), [])
+
+    def test_results_ranked_and_filtered(self):
+        '''Релевантные посты выше, фильтры по группе и автору работают'''
+        Post.objects.create(author=self.author, group=self.group,
+                            text='чай чай чай')
+        Post.objects.create(author=self.other,
+                            text='чай и много других слов про кофе')
+        self.assertEqual(self.search(q='чай'),
+                         ['чай чай чай', 'чай и много других слов про кофе'])
+        self.assertEqual(self.search(q='чай', group='group'),
+                         ['чай чай чай'])
+        self.assertEqual(self.search(q='чай', author='other'),
+                         ['чай и много других слов про кофе'])
+        self.assertEqual(self.search(q='чай кофе'),
+                         ['чай и много других слов про кофе'])
+        self.assertEqual(self.search(q='"; DROP'), [])
+
+    @override_settings(POSTS_PER_PAGE=2)
+    def test_cursor_pages(self):
+        '''Курсоры обходят всю выдачу без повторов в обе стороны'''
+        for i in range(5):
+            Post.objects.create(author=self.author, text=f'слово {i}')
+        url = reverse('posts:search')
+        seen = []
+        pages = []
+        response = self.client.get(url, {'q': 'слово'})
+        while True:
+            page = response.context['page_obj']
+            pages.append([post.pk for post in page])
+            seen += pages[-1]
+            if not page.has_next():
+                break
+            response = self.client.get(
+                url, {'q': 'слово', 'cursor': page.next_cursor})
+        self.assertEqual(sorted(seen),
+                         sorted(Post.objects.values_list('pk', flat=True)))
+        previous = self.client.get(url, {
+            'q': 'слово',
+            'cursor': response.context['page_obj'].previous_cursor,
+        })
+        self.assertEqual([post.pk for post in previous.context['page_obj']],
+                         pages[-2])
+        self.assertContains(response, 'q=%D1%81%D0%BB%D0%BE%D0%B2%D0%BE&')
+
+    def test_bad_cursor_opens_first_page(self):
+        '''Курсор с неподходящими значениями открывает начало выдачи'''
+        Post.objects.create(author=self.author, text='слово')
+        for values in ([[1], {}], ['foo', 1], [0.5]):
+            with self.subTest(values=values):
+                self.assertEqual(self.search(
+                    q='слово', cursor=encode_cursor(FORWARD, values)),
+                    ['слово'])
+
+    def test_rebuild_command(self):
+        '''Команда заново индексирует посты, созданные в обход сигналов'''
+        Post.objects.bulk_create(
+            Post(author=self.author, text=f'массовый {i}') for i in range(3))
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {TABLE}')
+        self.assertEqual(self.search(q='массовый'), [])
+        call_command('rebuild_search_index', batch_size=2, stdout=StringIO())
+        self.assertEqual(len(self.search(q='массовый')), 3)
@@ -0,0 +1,59 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.signals import request_finished
+from django.db import close_old_connections
+from django.test import TestCase
+
+from ..models import Comment, Follow, Post, TimelineEntry, User, UserStats
+
+
+class SeedAndBenchmarkTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # WSGI-приложение закрывает соединение после ответа, а с ним и
+        # транзакцию теста; тестовый клиент Django отключает это так же.
+        request_finished.disconnect(close_old_connections)
+        self.addCleanup(request_finished.connect, close_old_connections)
+
+    def seed(self):
+        call_command('seed_data', users=60, posts=600, groups=3,
+                     comments=300, batch_size=100, stdout=StringIO())
+
+    def test_seed_is_skewed_and_consistent(self):
+        '''Данные с перекосом, производные данные пересобраны'''
+        self.seed()
+        self.assertEqual(User.objects.count(), 60)
+        self.assertEqual(Post.objects.count(), 600)
+        self.assertEqual(Comment.objects.count(), 300)
+        top = UserStats.objects.order_by('-post_count').first()
+        self.assertGreater(top.post_count, 600 / 60 * 3)
+        self.assertEqual(top.post_count, Post.objects.filter(
+            author_id=top.user_id).count())
+        self.assertTrue(Follow.objects.exists())
+        self.assertTrue(TimelineEntry.objects.exists())
+
+    def test_benchmark_reports_every_url(self):
+        '''Бенчмарк выдаёт перцентили, запросы и память по всем адресам'''
+        self.seed()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'run.json')
+            call_command('benchmark_urls', requests=3, warmup=1,
+                         output=path, stdout=StringIO())
+            err = StringIO()
+            call_command('benchmark_urls', requests=3, warmup=0,
+                         compare=path, stdout=StringIO(), stderr=err)
+            with open(path, encoding='utf-8') as output:
+                report = json.load(output)
+        results = report['results']
+        self.assertIn('index', results)
+        self.assertIn('search', results)
+        self.assertEqual(results['index']['status'], 200)
+        for result in results.values():
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+            self.assertGreaterEqual(result['peak_memory_kib'], 0)
+        self.assertIn('index: p50_ms', err.getvalue())
@@ -0,0 +1,119 @@
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from sorl.thumbnail import default
+
+from ..cache import bump, get_versions, post_scope
+from ..models import Post, User
+from ..thumbnails import GEOMETRIES, _thumbnail_file, attach_thumbnails
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (b'\x47\x49\x46\x38\x39\x61\x02\x00'
+             b'\x01\x00\x80\x00\x00\x00\x00\x00'
+             b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+             b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+             b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+             b'\x0A\x00\x3B')
+
+
+# В TestCase транзакция не коммитится, поэтому on_commit выполняется сразу.
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+@mock.patch('posts.thumbnails.transaction.on_commit', lambda func: func())
+@mock.patch('posts.thumbnails.get_thumbnail')
+class ThumbnailTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def image(self, name='small.gif'):
+        return SimpleUploadedFile(name=name, content=SMALL_GIF,
+                                  content_type='image/gif')
+
+    def test_upload_queues_every_geometry(self, get_thumbnail):
+        '''Создание и правка поста с картинкой режут её миниатюры'''
+        self.client.post(reverse('posts:post_create'),
+                         data={'text': 'Пост', 'image': self.image()})
+        post = Post.objects.get()
+        get_thumbnail.assert_called_once_with(
+            post.image.name, '960x339', crop='center', upscale=True)
+
+        get_thumbnail.reset_mock()
+        edit_url = reverse('posts:post_edit', args=[post.pk])
+        self.client.post(edit_url, data={'text': 'Правка'})
+        get_thumbnail.assert_not_called()
+        self.client.post(edit_url, data={'text': 'Правка',
+                                         'image': self.image('new.gif')})
+        post.refresh_from_db()
+        get_thumbnail.assert_called_once_with(
+            post.image.name, '960x339', crop='center', upscale=True)
+
+    def mark_ready(self, post):
+        geometry, options = GEOMETRIES['card']
+        thumbnail = _thumbnail_file(post.image.name, geometry, options)
+        thumbnail.set_size((960, 339))
+        default.kvstore._set(thumbnail.key, thumbnail)
+        # Как generate: готовая миниатюра сбрасывает страницы поста.
+        bump(post_scope(post.pk))
+        return thumbnail
+
+    def test_placeholder_until_thumbnail_ready(self, get_thumbnail):
+        '''Пока миниатюры нет, вместо неё показывается заглушка'''
+        post = Post.objects.create(author=self.user, text='Пост',
+                                   image='posts/small.gif')
+        url = reverse('posts:post_detail', args=[post.pk])
+        response = self.client.get(url)
+        self.assertContains(response, 'thumbnail-placeholder')
+
+        thumbnail = self.mark_ready(post)
+        response = self.client.get(url)
+        self.assertNotContains(response, 'thumbnail-placeholder')
+        self.assertContains(response, thumbnail.url)
+
+    def test_page_thumbnails_resolved_in_batch(self, get_thumbnail):
+        '''Адреса миниатюр страницы читаются одним запросом'''
+        posts = [
+            Post.objects.create(author=self.user, text=f'Пост {i}',
+                                image=f'posts/small{i}.gif')
+            for i in range(3)
+        ]
+        ready = [self.mark_ready(post) for post in posts[:2]]
+        cache.clear()
+        with self.assertNumQueries(1):
+            attach_thumbnails(posts)
+        self.assertEqual([post.thumbnail_url for post in posts],
+                         [ready[0].url, ready[1].url, None])
+        with self.assertNumQueries(0):
+            attach_thumbnails(posts)
+
+    def test_backfill_command(self, get_thumbnail):
+        '''Команда нарезает миниатюры всех картинок и сбрасывает карточки'''
+        with_image = Post.objects.create(author=self.user, text='С картинкой',
+                                         image='posts/small.gif')
+        Post.objects.create(author=self.user, text='Без картинки')
+        versions = get_versions([post_scope(with_image.pk)])
+        out = StringIO()
+        call_command('backfill_thumbnails', workers=0, stdout=out)
+        get_thumbnail.assert_called_once_with(
+            with_image.image.name, '960x339', crop='center', upscale=True)
+        self.assertIn('1', out.getvalue())
+        self.assertNotEqual(get_versions([post_scope(with_image.pk)]),
+                            versions)
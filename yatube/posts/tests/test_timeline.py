@@ -0,0 +1,163 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Follow, Post, TimelineEntry, User
+from ..timeline import timeline_posts, trim
+
+
+class TimelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.old_post = Post.objects.create(author=cls.author,
+                                           text='Старый пост')
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def entries(self):
+        return list(TimelineEntry.objects.filter(user=self.reader)
+                    .values_list('post_id', flat=True))
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        '''Подписка добавляет посты автора в ленту, отписка убирает'''
+        self.reader_client.get(reverse('posts:profile_follow',
+                                       kwargs={'username': 'author'}))
+        self.assertEqual(self.entries(), [self.old_post.pk])
+        self.reader_client.get(reverse('posts:profile_unfollow',
+                                       kwargs={'username': 'author'}))
+        self.assertEqual(self.entries(), [])
+
+    def test_new_post_fans_out_to_followers(self):
+        '''Новый пост попадает в ленты подписчиков и на /follow/'''
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertIn(post.pk, self.entries())
+        response = self.reader_client.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']),
+                         [post, self.old_post])
+
+    @override_settings(TIMELINE_LENGTH=2, TIMELINE_TRIM_INTERVAL=1)
+    def test_timeline_is_capped(self):
+        '''В ленте хранится не больше TIMELINE_LENGTH записей'''
+        Follow.objects.create(user=self.reader, author=self.author)
+        posts = [Post.objects.create(author=self.author, text=f'Пост {i}')
+                 for i in range(3)]
+        self.assertCountEqual(self.entries(),
+                              [posts[2].pk, posts[1].pk])
+
+    @override_settings(TIMELINE_LENGTH=2, TIMELINE_TRIM_INTERVAL=1)
+    def test_trim_query_count_does_not_grow_with_followers(self):
+        '''Обрезка лент стоит одного запроса, сколько бы ни было подписчиков'''
+        followers = [User.objects.create_user(username=f'follower{i}')
+                     for i in range(5)]
+        for follower in followers:
+            Follow.objects.create(user=follower, author=self.author)
+        Post.objects.create(author=self.author, text='Пост 1')
+        with CaptureQueriesContext(connection) as queries:
+            trim([follower.pk for follower in followers])
+        self.assertEqual(len(queries.captured_queries), 1)
+        for follower in followers:
+            self.assertEqual(
+                TimelineEntry.objects.filter(user=follower).count(), 2)
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_celebrity_posts_are_pulled(self):
+        '''Посты популярных авторов не рассылаются, а читаются при запросе'''
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertEqual(self.entries(), [])
+        self.assertEqual(list(timeline_posts(self.reader)),
+                         [post, self.old_post])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_posts_fanned_out_when_author_drops_under_limit(self):
+        '''Автор, потерявший подписчиков, снова рассылает свои посты'''
+        other = User.objects.create_user(username='other')
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=other, author=self.author)
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertEqual(self.entries(), [self.old_post.pk])
+        Follow.objects.filter(user=other).delete()
+        self.assertCountEqual(self.entries(), [post.pk, self.old_post.pk])
+        response = self.reader_client.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']),
+                         [post, self.old_post])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_feed_refreshed_when_author_crosses_limit(self):
+        '''Лента видит посты автора, ставшего знаменитостью'''
+        Follow.objects.create(user=self.reader, author=self.author)
+        url = reverse('posts:follow_index')
+        self.reader_client.get(url)
+        other = User.objects.create_user(username='other')
+        Follow.objects.create(user=other, author=self.author)
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertEqual(self.entries(), [self.old_post.pk])
+        response = self.reader_client.get(url)
+        self.assertEqual(list(response.context['page_obj']),
+                         [post, self.old_post])
+
+
+class FollowFeedCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.other = User.objects.create_user(username='other')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.old_post = Post.objects.create(author=cls.author,
+                                           text='Старый пост')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        self.url = reverse('posts:follow_index')
+
+    def feed(self):
+        return list(self.reader_client.get(self.url).context['page_obj'])
+
+    def test_warm_feed_is_one_query(self):
+        '''Из кеша лента собирается одним запросом по первичным ключам'''
+        self.feed()
+        # Сессия и пользователь в кеше, остаются посты по id.
+        with self.assertNumQueries(1):
+            response = self.reader_client.get(self.url)
+        self.assertEqual(list(response.context['page_obj']),
+                         [self.old_post])
+
+    def test_feed_invalidated_for_followers_only(self):
+        '''Новый и удалённый пост автора сбрасывают ленты его подписчиков'''
+        self.feed()
+        Post.objects.create(author=self.other, text='Чужой пост')
+        with self.assertNumQueries(1):
+            self.feed()
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertEqual(self.feed(), [post, self.old_post])
+        post.delete()
+        self.assertEqual(self.feed(), [self.old_post])
+
+    def test_feed_invalidated_by_follow_and_unfollow(self):
+        '''Подписка и отписка сразу меняют ленту'''
+        self.feed()
+        post = Post.objects.create(author=self.other, text='Пост other')
+        follow = Follow.objects.create(user=self.reader, author=self.other)
+        self.assertEqual(self.feed(), [post, self.old_post])
+        follow.delete()
+        self.assertEqual(self.feed(), [self.old_post])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_pulled_author_posts_refresh_feed(self):
+        '''Пост подмешиваемого автора сбрасывает ленту через его версию'''
+        self.feed()
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertEqual(self.feed(), [post, self.old_post])
@@ -1,10 +1,13 @@
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
 from django.conf import settings
 from django.urls import reverse
 from django import forms
 from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
-from ..models import Group, Post, User
+from ..models import Comment, Follow, Group, Post, User
+from ..utils import FORWARD, encode_cursor
 
 
 class PostViewsTests(TestCase):
@@ -133,20 +136,65 @@ class PostViewsTests(TestCase):
                 form_field = response.context['page_obj']
                 self.assertIn(PostViewsTests.post, form_field)
 
+    def test_group_and_author_with_posts_deleted(self):
+        '''Удаление группы и автора вместе с постами сбрасывает страницы'''
+        index = reverse('posts:index')
+        self.guest_client.get(index)
+        author = User.objects.create_user(username='leaving')
+        Follow.objects.create(user=self.user, author=author)
+        group = Group.objects.create(title='Другая', slug='other',
+                                     description='Описание')
+        Post.objects.create(text='Пост группы', author=self.post.author,
+                            group=group)
+        Post.objects.create(text='Пост автора', author=author,
+                            group=self.group)
+        profile = reverse('posts:profile', kwargs={'username': 'leaving'})
+        self.assertContains(self.guest_client.get(profile), 'Пост автора')
+        self.guest_client.get(index)
+        group.delete()
+        author.delete()
+        response = self.guest_client.get(index)
+        self.assertNotContains(response, 'Пост группы')
+        self.assertNotContains(response, 'Пост автора')
+        self.assertEqual(response.context['page_obj'].paginator.count, 1)
+        self.assertEqual(self.guest_client.get(profile).status_code, 404)
+
     def test_index_cach(self):
-        '''Проверяется кеширование страницы index'''
+        '''Проверяется кеширование страницы index: без изменений
+        отдаётся кеш, изменение поста сразу сбрасывает страницу'''
         post = Post.objects.create(
             text='Новый пост',
             author=self.post.author
         )
         post_create = self.guest_client.get(reverse('posts:index'))
+        Post.objects.filter(pk=post.pk).update(text='Изменён в обход ORM')
+        post_update = self.guest_client.get(reverse('posts:index'))
+        self.assertEqual(post_create.content, post_update.content)
+
         post.delete()
         post_delete = self.guest_client.get(reverse('posts:index'))
-        self.assertEqual(post_create.content, post_delete.content)
+        self.assertNotEqual(post_create.content, post_delete.content)
 
         cache.clear()
         post_after_cach_clear = self.guest_client.get(reverse('posts:index'))
-        self.assertNotEqual(post_create.content, post_after_cach_clear.content)
+        self.assertEqual(post_delete.content, post_after_cach_clear.content)
+
+    def test_pages_invalidated_on_change(self):
+        '''Новый пост сразу виден на закешированных
+        страницах ленты, группы и профиля'''
+        pages = [reverse('posts:index'),
+                 reverse('posts:group_list',
+                         kwargs={'slug': self.group.slug}),
+                 reverse('posts:profile',
+                         kwargs={'username': self.user.username})]
+        for page in pages:
+            self.guest_client.get(page)
+        Post.objects.create(text='Свежий пост', author=self.user,
+                            group=self.group)
+        for page in pages:
+            with self.subTest(page=page):
+                response = self.guest_client.get(page)
+                self.assertContains(response, 'Свежий пост')
 
 
 class PaginatorViewsTest(TestCase):
@@ -196,3 +244,207 @@ class PaginatorViewsTest(TestCase):
             with self.subTest(page=page):
                 response = self.authorized_client.get(page + '?page=2')
                 self.assertEqual(len(response.context['page_obj']), 3)
+
+
+@override_settings(POSTS_PER_PAGE=1, PAGINATOR_WINDOW=1)
+class WindowedPaginatorViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        Post.objects.bulk_create(
+            Post(text=f'Тестовый текст {i}', author=cls.user,
+                 group=cls.group)
+            for i in range(13)
+        )
+        cls.url = reverse('posts:group_list',
+                          kwargs={'slug': cls.group.slug})
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def test_window_around_current_page(self):
+        '''Выводятся первая, последняя и соседние с текущей страницы'''
+        response = self.guest_client.get(self.url, {'page': 7})
+        for number in (1, 6, 8, 13):
+            self.assertContains(response, f'href="?page={number}"')
+        for number in (2, 5, 9, 12):
+            self.assertNotContains(response, f'href="?page={number}"')
+        self.assertContains(response, '&hellip;', count=2)
+
+    def test_count_cached_and_shifted_by_signals(self):
+        '''Число постов не пересчитывается, а сдвигается сигналами'''
+        self.guest_client.get(self.url)
+        post = Post.objects.create(text='Новый', author=self.user,
+                                   group=self.group)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.guest_client.get(self.url)
+        self.assertEqual(response.context['page_obj'].paginator.count, 14)
+        self.assertFalse(any('COUNT' in query['sql']
+                             for query in queries.captured_queries))
+        post.delete()
+        response = self.guest_client.get(self.url)
+        self.assertEqual(response.context['page_obj'].paginator.count, 13)
+
+    @override_settings(PAGINATOR_EXACT_COUNT_LIMIT=5)
+    def test_approximate_count_above_limit(self):
+        '''Выше порога нет ссылки на последнюю страницу, хвост уточняет'''
+        response = self.guest_client.get(self.url)
+        self.assertTrue(response.context['page_obj'].paginator.approximate)
+        self.assertNotContains(response, 'Последняя')
+        response = self.guest_client.get(self.url, {'page': 12})
+        self.assertTrue(response.context['page_obj'].has_next())
+        response = self.guest_client.get(self.url, {'page': 13})
+        page_obj = response.context['page_obj']
+        self.assertEqual(len(page_obj), 1)
+        self.assertFalse(page_obj.has_next())
+        self.assertEqual(page_obj.paginator.count, 13)
+
+    @override_settings(PAGINATOR_EXACT_COUNT_LIMIT=5)
+    def test_approximate_page_past_end(self):
+        '''Номер за концом ленты открывает её последнюю страницу'''
+        for number in (50, 10 ** 23):
+            with self.subTest(number=number):
+                cache.clear()
+                response = self.guest_client.get(self.url, {'page': number})
+                self.assertEqual(response.status_code, 200)
+                page_obj = response.context['page_obj']
+                self.assertEqual(page_obj.number, 13)
+                self.assertEqual(len(page_obj), 1)
+                self.assertEqual(page_obj.paginator.count, 13)
+
+
+@override_settings(CURSOR_PAGINATION_VIEWS=('posts:index',
+                                            'posts:group_list',
+                                            'posts:profile'))
+class CursorPaginatorViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        objs = (Post(text=f'Тестовый текст {i}',
+                     author=cls.user, group=cls.group)
+                for i in range(settings.POSTS_PER_PAGE + 3))
+        Post.objects.bulk_create(objs)
+        cls.pages = [reverse('posts:index'),
+                     reverse('posts:group_list',
+                             kwargs={'slug': cls.group.slug}),
+                     reverse('posts:profile',
+                             kwargs={'username': cls.user.username})]
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def test_cursor_pages_walk_forward_and_back(self):
+        '''Курсоры ведут на следующую и обратно на предыдущую страницу'''
+        expected = list(Post.objects.order_by('-pub_date', '-id'))
+        for page in self.pages:
+            with self.subTest(page=page):
+                first = self.guest_client.get(page).context['page_obj']
+                self.assertEqual(list(first),
+                                 expected[:settings.POSTS_PER_PAGE])
+                self.assertFalse(first.has_previous())
+                second = self.guest_client.get(
+                    page, {'cursor': first.next_cursor}
+                ).context['page_obj']
+                self.assertEqual(list(second),
+                                 expected[settings.POSTS_PER_PAGE:])
+                self.assertFalse(second.has_next())
+                back = self.guest_client.get(
+                    page, {'cursor': second.previous_cursor}
+                ).context['page_obj']
+                self.assertEqual(list(back), list(first))
+                self.assertFalse(back.has_previous())
+
+    def test_broken_cursor_opens_first_page(self):
+        '''Испорченный курсор открывает первую страницу'''
+        response = self.guest_client.get(self.pages[0], {'cursor': '!!!'})
+        self.assertEqual(len(response.context['page_obj']),
+                         settings.POSTS_PER_PAGE)
+
+    def test_cursor_with_bad_values_opens_first_page(self):
+        '''Курсор с неподходящими значениями открывает первую страницу'''
+        for values in (['foo', 1], [[1], {}], [None, 1], ['2020-01-01']):
+            with self.subTest(values=values):
+                response = self.guest_client.get(
+                    self.pages[0],
+                    {'cursor': encode_cursor(FORWARD, values)})
+                self.assertEqual(response.status_code, 200)
+                self.assertFalse(response.context['page_obj'].has_previous())
+
+    def test_cursor_links_rendered(self):
+        '''Вместо номеров страниц выводятся ссылки с курсором'''
+        response = self.guest_client.get(self.pages[0])
+        self.assertContains(response, '?cursor=')
+        self.assertNotContains(response, '?page=')
+
+
+@override_settings(COMMENTS_PER_PAGE=2)
+class CommentPagesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(author=cls.user, text='Пост')
+        Comment.objects.bulk_create(
+            Comment(post=cls.post, author=cls.user, text=f'Комментарий {i}')
+            for i in range(5)
+        )
+        cls.url = reverse('posts:post_comments', args=[cls.post.pk])
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def test_comments_load_in_portions(self):
+        '''Страница поста показывает порцию, остальное догружается'''
+        response = self.guest_client.get(
+            reverse('posts:post_detail', args=[self.post.pk]))
+        self.assertContains(response, 'Комментарий 1')
+        self.assertNotContains(response, 'Комментарий 2')
+        self.assertContains(response, self.url + '?cursor=')
+        cursor = response.context['comments'].next_cursor
+        response = self.guest_client.get(self.url, {'cursor': cursor})
+        self.assertContains(response, 'Комментарий 3')
+        self.assertNotContains(response, 'Комментарий 1')
+        self.assertNotContains(response, '<html')
+        cursor = response.context['comments'].next_cursor
+        response = self.guest_client.get(self.url, {'cursor': cursor})
+        self.assertContains(response, 'Комментарий 4')
+        self.assertNotContains(response, 'data-more-comments')
+
+    def test_fragment_cached_until_new_comment(self):
+        '''Фрагмент берётся из кеша, пока не появится комментарий'''
+        self.guest_client.get(self.url)
+        with self.assertNumQueries(0):
+            self.guest_client.get(self.url)
+        Comment.objects.create(post=self.post, author=self.user,
+                               text='Свежий')
+        with self.assertNumQueries(1):
+            self.guest_client.get(self.url)
+
+    def test_bad_cursor_opens_first_comments(self):
+        '''Испорченный курсор комментариев отдаёт первую порцию'''
+        for cursor in ('!!!', encode_cursor(FORWARD, ['foo', 'bar'])):
+            with self.subTest(cursor=cursor):
+                response = self.guest_client.get(self.url,
+                                                 {'cursor': cursor})
+                self.assertContains(response, 'Комментарий 0')
+
+    def test_missing_post(self):
+        '''Для несуществующего поста фрагмент отвечает 404'''
+        response = self.guest_client.get(
+            reverse('posts:post_comments', args=[self.post.pk + 100]))
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,173 @@
+"""Миниатюры картинок постов, нарезанные заранее в пуле процессов.
+
+Картинка режется во всех размерах, которые используют шаблоны, сразу
+после сохранения поста, а не при первом показе страницы.
+Представления узнают адреса готовых миниатюр для всей страницы сразу,
+шаблоны только читают их, а до нарезки показывают заглушку. Когда
+миниатюра готова, версии страниц поста сдвигаются, и закешированные
+карточки с заглушкой перестают совпадать по ключу.
+"""
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.db import transaction
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.models import KVStore
+
+from . import cache
+
+logger = logging.getLogger(__name__)
+
+# Все размеры, в которых шаблоны показывают картинки постов.
+GEOMETRIES = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+}
+
+_pool = None
+
+
+def setup_worker():
+    """Инициализатор воркера пула.
+
+    Воркеры запускаются через spawn: свежий интерпретатор не делит с
+    родителем ни соединения с БД, ни блокировки.
+    """
+    import django
+    django.setup()
+
+
+def pool():
+    """Общий пул процессов нарезки, создаётся при первой задаче."""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=setup_worker,
+        )
+    return _pool
+
+
+def _thumbnail_file(image, geometry, options):
+    # Те же умолчания, что подставляет ThumbnailBackend.get_thumbnail,
+    # иначе имя файла не совпадёт с нарезанным.
+    backend = default.backend
+    source = ImageFile(image)
+    options = dict(options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    name = backend._get_thumbnail_filename(source, geometry, options)
+    return ImageFile(name, default.storage)
+
+
+def thumbnail_urls(images, size):
+    """URL готовых миниатюр размера size по именам картинок.
+
+    Весь список читается из кеша хранилища sorl одним get_many, промахи
+    добираются из БД одним запросом. Картинок, ещё не нарезанных пулом,
+    в ответе нет: шаблон покажет для них заглушку.
+    """
+    geometry, options = GEOMETRIES[size]
+    keys = {}
+    for image in images:
+        thumbnail = _thumbnail_file(image, geometry, options)
+        keys[add_prefix(thumbnail.key)] = str(image)
+    if not keys:
+        return {}
+    kv_cache = default.kvstore.cache
+    values = kv_cache.get_many(keys)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        found = dict(
+            KVStore.objects.filter(key__in=missing).values_list('key', 'value')
+        )
+        # Как и сам sorl, запоминаем и отсутствие записи, чтобы не
+        # ходить в БД за каждой ненарезанной картинкой.
+        fetched = {key: found.get(key, EMPTY_VALUE) for key in missing}
+        kv_cache.set_many(fetched, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        values.update(fetched)
+    return {
+        keys[key]: deserialize_image_file(value).url
+        for key, value in values.items()
+        if value and value != EMPTY_VALUE
+    }
+
+
+def attach_thumbnails(posts, size='card'):
+    """Проставляет постам страницы thumbnail_url одним походом в кеш."""
+    posts = list(posts)
+    urls = thumbnail_urls([post.image for post in posts if post.image], size)
+    for post in posts:
+        post.thumbnail_url = urls.get(post.image.name) if post.image else None
+    return posts
+
+
+def ready_images(images):
+    """Картинки, у которых нарезаны все размеры."""
+    ready = {str(image) for image in images}
+    for size in GEOMETRIES:
+        ready &= set(thumbnail_urls(ready, size))
+    return ready
+
+
+def generate(items):
+    """Нарезает картинки пачки постов [(post_id, image), ...].
+
+    Выполняется в воркере пула. Возвращает число обработанных картинок.
+    """
+    from .models import Post
+
+    done = []
+    for post_id, image in items:
+        try:
+            for geometry, options in GEOMETRIES.values():
+                get_thumbnail(image, geometry, **options)
+        except Exception:
+            logger.exception('Не удалось нарезать миниатюры %s', image)
+        else:
+            done.append(post_id)
+    posts = Post.objects.filter(pk__in=done).select_related('author', 'group')
+    scopes = [scope for post in posts for scope in cache.post_scopes(post)]
+    if scopes:
+        cache.bump(*scopes)
+    return len(done)
+
+
+def _log_failure(future):
+    if future.exception() is not None:
+        logger.error('Пул миниатюр упал: %r', future.exception())
+
+
+def _submit(items):
+    global _pool
+    if not settings.THUMBNAIL_WORKERS:
+        generate(items)
+        return
+    try:
+        pool().submit(generate, items).add_done_callback(_log_failure)
+    except BrokenProcessPool:
+        # Убитый воркер ломает весь пул: следующая задача поднимет новый.
+        logger.exception('Пул миниатюр сломан, задача потеряна: %s', items)
+        _pool = None
+
+
+def queue(post):
+    """Ставит нарезку картинки поста в очередь после коммита."""
+    if not post.image:
+        return
+    items = [(post.pk, post.image.name)]
+    transaction.on_commit(lambda: _submit(items))
@@ -0,0 +1,275 @@
+"""Материализованные ленты подписок (fan-out on write).
+
+Новый пост раскладывается в ленты всех подписчиков автора, и
+follow_index читает ленту по индексу (user, pub_date) без join
+через Follow. Посты авторов с очень большим числом подписчиков в
+ленты не раскладываются: они подмешиваются при чтении (pull), чтобы
+один пост не порождал лавину записей.
+
+Первые страницы ленты каждого читателя хранятся в кеше списком id
+постов. Его сбрасывают изменения самой ленты: рассылка нового поста,
+удаление поста, подписка и отписка. Посты подмешиваемых авторов в
+ленты не попадают, поэтому запись кеша помнит версии их областей и
+устаревает вместе с ними.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F, Q
+
+from core import replicas
+from .cache import author_scope, get_versions
+from .counters import id_batches
+from .models import Follow, Post, TimelineEntry, User, UserStats
+
+
+def is_celebrity(author_id):
+    """Автор, посты которого читаются при запросе, а не рассылаются."""
+    return UserStats.objects.filter(
+        user_id=author_id,
+        follower_count__gt=settings.TIMELINE_FANOUT_LIMIT,
+    ).exists()
+
+
+def celebrity_authors(user):
+    """id авторов из подписок user, которых нужно подмешивать при чтении."""
+    return list(
+        Follow.objects.filter(
+            user=user,
+            author__stats__follower_count__gt=settings.TIMELINE_FANOUT_LIMIT,
+        ).values_list('author_id', flat=True)
+    )
+
+
+def _feed_key(user_id):
+    return f'follow_feed:{user_id}'
+
+
+def forget(user_ids):
+    """Сбрасывает закешированные первые страницы лент читателей."""
+    cache.delete_many([_feed_key(user_id) for user_id in user_ids])
+
+
+def forget_post(post):
+    """Сбрасывает ленты, в которые был разослан удалённый пост."""
+    if not is_celebrity(post.author_id):
+        forget(Follow.objects.filter(author_id=post.author_id)
+               .values_list('user_id', flat=True))
+
+
+# Сколько лент обрезать одним запросом: с запасом ниже ограничения
+# SQLite на число параметров.
+TRIM_BATCH = 500
+
+
+def trim(user_ids):
+    """Обрезает ленты до TIMELINE_LENGTH самых свежих записей.
+
+    Один DELETE на пачку лент: лишние записи находит ROW_NUMBER по
+    индексу (user, pub_date).
+    """
+    user_ids = list(user_ids)
+    table = TimelineEntry._meta.db_table
+    for start in range(0, len(user_ids), TRIM_BATCH):
+        batch = user_ids[start:start + TRIM_BATCH]
+        placeholders = ', '.join(['%s'] * len(batch))
+        sql = (
+            f'DELETE FROM {table} WHERE id IN ('
+            'SELECT id FROM ('
+            'SELECT id, ROW_NUMBER() OVER (PARTITION BY user_id '
+            'ORDER BY pub_date DESC, post_id DESC) AS position '
+            f'FROM {table} WHERE user_id IN ({placeholders})'
+            ') WHERE position > %s)'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [*batch, settings.TIMELINE_LENGTH])
+
+
+def fan_out(post):
+    """Кладёт новый пост в ленты подписчиков автора."""
+    followers, posts = (
+        UserStats.objects.filter(user_id=post.author_id)
+        .values_list('follower_count', 'post_count').first() or (0, 0)
+    )
+    if followers > settings.TIMELINE_FANOUT_LIMIT:
+        return
+    follower_ids = list(
+        Follow.objects.filter(author_id=post.author_id)
+        .values_list('user_id', flat=True)
+    )
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+         for user_id in follower_ids),
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+    forget(follower_ids)
+    # Обрезка перебирает ленты всех подписчиков, поэтому делается на
+    # каждый TIMELINE_TRIM_INTERVAL-й пост автора: длина ленты
+    # ограничена мягко.
+    if posts % settings.TIMELINE_TRIM_INTERVAL == 0:
+        trim(follower_ids)
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту свежие посты автора после подписки."""
+    forget([user_id])
+    if is_celebrity(author_id):
+        return
+    posts = (
+        Post.objects.filter(author_id=author_id)
+        .order_by('-pub_date')
+        .values_list('id', 'pub_date')[:settings.TIMELINE_LENGTH]
+    )
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+         for post_id, pub_date in posts),
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+    trim([user_id])
+
+
+def rejoin_fan_out(author_id):
+    """Раскладывает посты автора, переставшего быть знаменитостью.
+
+    Пока у автора было больше TIMELINE_FANOUT_LIMIT подписчиков, его
+    посты в ленты не попадали, а подмешивались при чтении. Когда число
+    подписчиков опускается до порога, свежие посты автора добавляются
+    в ленты всех его подписчиков одним INSERT.
+    """
+    if not UserStats.objects.filter(
+            user_id=author_id,
+            follower_count=settings.TIMELINE_FANOUT_LIMIT).exists():
+        return
+    sql = (
+        f'INSERT OR IGNORE INTO {TimelineEntry._meta.db_table} '
+        '(user_id, post_id, pub_date) '
+        'SELECT follow.user_id, post.id, post.pub_date '
+        f'FROM {Follow._meta.db_table} follow JOIN ('
+        f'SELECT id, pub_date FROM {Post._meta.db_table} '
+        'WHERE author_id = %s ORDER BY pub_date DESC, id DESC LIMIT %s'
+        ') post WHERE follow.author_id = %s'
+    )
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(sql, [author_id, settings.TIMELINE_LENGTH, author_id])
+    follower_ids = list(
+        Follow.objects.filter(author_id=author_id)
+        .values_list('user_id', flat=True)
+    )
+    forget(follower_ids)
+    trim(follower_ids)
+
+
+def leave_fan_out(author_id):
+    """Сбрасывает ленты подписчиков автора, ставшего знаменитостью.
+
+    Пока посты автора рассылались, закешированные ленты его подписчиков
+    не следили за его версиями, а новые посты в них больше не попадут:
+    они подмешиваются при чтении. Поэтому, когда число подписчиков
+    превышает порог, эти ленты собираются заново.
+    """
+    if not UserStats.objects.filter(
+            user_id=author_id,
+            follower_count=settings.TIMELINE_FANOUT_LIMIT + 1).exists():
+        return
+    forget(Follow.objects.filter(author_id=author_id)
+           .values_list('user_id', flat=True))
+
+
+def prune(user_id, author_id):
+    """Убирает из ленты посты автора после отписки."""
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id
+    ).delete()
+    forget([user_id])
+
+
+def rebuild_timelines(batch_size=1000):
+    """Строит ленты всех пользователей с нуля одним INSERT на пачку.
+
+    Нужна после загрузки данных в обход сигналов (bulk_create, импорт).
+    Каждая лента сразу ограничивается TIMELINE_LENGTH записями.
+    """
+    # Авторов-знаменитостей отсекаем по подписке, до JOIN с постами:
+    # проверка на каждой строке поста обходится в разы дороже.
+    sql = (
+        f'INSERT OR IGNORE INTO {TimelineEntry._meta.db_table} '
+        '(user_id, post_id, pub_date) '
+        'SELECT user_id, post_id, pub_date FROM ('
+        'SELECT follow.user_id, post.id AS post_id, post.pub_date, '
+        'ROW_NUMBER() OVER (PARTITION BY follow.user_id '
+        'ORDER BY post.pub_date DESC, post.id DESC) AS position '
+        f'FROM {Follow._meta.db_table} follow '
+        f'JOIN {Post._meta.db_table} post '
+        'ON post.author_id = follow.author_id '
+        'WHERE follow.user_id IN ({ids}) '
+        'AND follow.author_id NOT IN ('
+        f'SELECT user_id FROM {UserStats._meta.db_table} '
+        'WHERE follower_count > %s)'
+        ') WHERE position <= %s'
+    )
+    TimelineEntry.objects.all().delete()
+    for user_ids in id_batches(User.objects.all(), batch_size):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                sql.format(ids=', '.join(['%s'] * len(user_ids))),
+                [*user_ids, settings.TIMELINE_FANOUT_LIMIT,
+                 settings.TIMELINE_LENGTH],
+            )
+
+
+def timeline_posts(user, pulled=None):
+    """Посты ленты подписок: материализованная часть плюс pull-авторы.
+
+    pulled — уже известные id подмешиваемых авторов.
+    """
+    if pulled is None:
+        pulled = celebrity_authors(user)
+    if not pulled:
+        return Post.objects.filter(timeline_entries__user=user).order_by(
+            F('timeline_entries__pub_date').desc(),
+            F('timeline_entries__post').desc(),
+        )
+    return Post.objects.filter(
+        Q(id__in=TimelineEntry.objects.filter(user=user).values('post_id'))
+        | Q(author_id__in=pulled)
+    )
+
+
+def cached_feed(user):
+    """Первые FOLLOW_FEED_CACHED_PAGES страниц ленты из кеша.
+
+    Возвращает id их постов, число постов ленты и id подмешиваемых
+    авторов. Промах собирает запись из базы; попадание базу не читает.
+    """
+    key = _feed_key(user.pk)
+    entry = cache.get(key)
+    if entry is not None and (
+            not entry['scopes']
+            or get_versions(entry['scopes']) == entry['versions']):
+        return entry['ids'], entry['count'], entry['pulled']
+    with replicas.cache_reads():
+        entry = _build_feed_entry(user)
+    cache.set(key, entry, settings.PAGE_CACHE_TIMEOUT)
+    return entry['ids'], entry['count'], entry['pulled']
+
+
+def _build_feed_entry(user):
+    pulled = dict(
+        Follow.objects.filter(
+            user=user,
+            author__stats__follower_count__gt=settings.TIMELINE_FANOUT_LIMIT,
+        ).values_list('author_id', 'author__username')
+    )
+    posts = timeline_posts(user, pulled=list(pulled))
+    length = settings.POSTS_PER_PAGE * settings.FOLLOW_FEED_CACHED_PAGES
+    scopes = [author_scope(username) for username in pulled.values()]
+    entry = {
+        'ids': list(posts.values_list('id', flat=True)[:length]),
+        'count': posts.count(),
+        'pulled': list(pulled),
+        'scopes': scopes,
+        'versions': get_versions(scopes),
+    }
+    return entry
@@ -1,8 +1,307 @@
-from yatube.settings import POSTS_PER_PAGE
-from django.core.paginator import Paginator
+import json
+import sys
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import date
+from functools import partial
 
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.db.models import Q
 
-def pagination(request, post_list):
-    paginator = Paginator(post_list, POSTS_PER_PAGE)
+from .counters import correct_feed_post_count, feed_post_count
+from .models import Comment
+
+FORWARD = 'n'
+BACKWARD = 'p'
+
+
+def _cursor_value(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} нельзя положить в курсор')
+
+
+def encode_cursor(direction, values):
+    """Упаковывает направление и значения ключа в непрозрачную строку."""
+    payload = json.dumps([direction, values], default=_cursor_value)
+    return urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor, converters):
+    """Распаковывает курсор; для испорченного курсора возвращает None.
+
+    converters — по функции на каждое значение ключа (обычно to_python
+    поля модели). Курсор приходит из адреса, поэтому значение, которое
+    не удалось преобразовать, тоже делает курсор испорченным.
+    """
+    try:
+        direction, values = json.loads(urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError, AttributeError):
+        return None
+    if (direction not in (FORWARD, BACKWARD)
+            or not isinstance(values, list)
+            or len(values) != len(converters)):
+        return None
+    try:
+        values = [convert(value)
+                  for convert, value in zip(converters, values)]
+    except (ValidationError, ValueError, TypeError):
+        return None
+    if None in values:
+        return None
+    return direction, values
+
+
+class CursorPage:
+    """Страница курсорной пагинации.
+
+    Повторяет ту часть интерфейса Page, которой пользуются шаблоны,
+    но вместо номеров страниц отдаёт курсоры соседних страниц.
+    """
+    is_cursor = True
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<CursorPage of {len(self)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """Пагинация по ключу (keyset) без COUNT(*) и OFFSET.
+
+    Страница выбирается одним запросом с условием «после ключа
+    последней записи», поэтому стоимость не зависит от глубины.
+    Последнее поле ordering должно быть уникальным.
+    """
+
+    def __init__(self, object_list, per_page, ordering=('-pub_date', '-id')):
+        self.object_list = object_list
+        self.per_page = per_page
+        self.ordering = tuple(ordering)
+
+    def _fields(self):
+        return [
+            (field.lstrip('-'), field.startswith('-'))
+            for field in self.ordering
+        ]
+
+    def _seek(self, values, direction):
+        condition = Q()
+        equal = {}
+        for (name, descending), value in zip(self._fields(), values):
+            lookup = 'lt' if descending == (direction == FORWARD) else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def _key(self, obj):
+        return [getattr(obj, name) for name, _ in self._fields()]
+
+    def _converters(self):
+        meta = self.object_list.model._meta
+        return [meta.get_field(name).to_python for name, _ in self._fields()]
+
+    def get_page(self, cursor=None):
+        decoded = decode_cursor(cursor, self._converters()) if cursor else None
+        direction, values = decoded or (FORWARD, None)
+        ordering = self.ordering
+        if direction == BACKWARD:
+            ordering = [
+                field[1:] if field.startswith('-') else f'-{field}'
+                for field in ordering
+            ]
+        queryset = self.object_list.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, direction))
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == BACKWARD:
+            rows.reverse()
+        if not rows:
+            return CursorPage(rows)
+        if direction == FORWARD:
+            has_next, has_previous = has_more, values is not None
+        else:
+            has_next, has_previous = True, has_more
+        return CursorPage(
+            rows,
+            next_cursor=(encode_cursor(FORWARD, self._key(rows[-1]))
+                         if has_next else None),
+            previous_cursor=(encode_cursor(BACKWARD, self._key(rows[0]))
+                             if has_previous else None),
+        )
+
+
+class CountedPaginator(Paginator):
+    """Paginator, которому число объектов известно заранее.
+
+    Позволяет взять его из денормализованного счётчика или кеша вместо
+    COUNT(*). Приближённое число (approximate) может быть неточным:
+    страница тогда читает одну лишнюю строку, чтобы честно знать, есть
+    ли следующая, а дойдя до конца ленты, уточняет count и вызывает
+    on_exact_count с точным числом.
+    """
+
+    def __init__(self, object_list, per_page, count, approximate=False,
+                 on_exact_count=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count = count
+        self.approximate = approximate
+        self.on_exact_count = on_exact_count
+
+    def validate_number(self, number):
+        if not self.approximate:
+            return super().validate_number(number)
+        # Оценка может быть и меньше настоящего числа, поэтому номер
+        # страницы не ограничивается оценённым num_pages.
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('Номер страницы должен быть числом')
+        if number < 1:
+            raise EmptyPage('Номер страницы меньше 1')
+        # OFFSET в SQL — 64-битное целое: такой страницы точно нет.
+        if number > sys.maxsize // self.per_page - 1:
+            self._set_exact_count(self.object_list.count())
+            raise EmptyPage('Номер страницы слишком велик')
+        return number
+
+    def get_page(self, number):
+        try:
+            return super().get_page(number)
+        except EmptyPage:
+            # Номер оказался за настоящим концом ленты: count уже
+            # уточнён, отдаём последнюю страницу, как Paginator.
+            return self.page(self.num_pages)
+
+    def page(self, number):
+        if not self.approximate:
+            return super().page(number)
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if len(rows) > self.per_page:
+            self._set_count(max(self.count, bottom + len(rows)))
+        elif rows or number == 1:
+            self._set_exact_count(bottom + len(rows))
+        else:
+            # Страница за концом ленты: где конец, знает только COUNT.
+            self._set_exact_count(self.object_list.count())
+            raise EmptyPage('На этой странице нет постов')
+        return self._get_page(rows[:self.per_page], number, self)
+
+    def _set_exact_count(self, count):
+        self._set_count(count)
+        self.approximate = False
+        if self.on_exact_count:
+            self.on_exact_count(count)
+
+    def _set_count(self, count):
+        self.count = count
+        self.__dict__.pop('num_pages', None)
+
+
+def page_window(page, size=None):
+    """Номера страниц вокруг текущей для навигации.
+
+    Первая, последняя и по size страниц с каждой стороны от текущей;
+    None обозначает пропуск. При приближённом числе страниц последняя
+    не показывается, а хвост всегда заканчивается пропуском.
+    """
+    size = settings.PAGINATOR_WINDOW if size is None else size
+    last = page.paginator.num_pages
+    approximate = getattr(page.paginator, 'approximate', False)
+    numbers = {1, *range(page.number - size, page.number + size + 1)}
+    if not approximate:
+        numbers.add(last)
+    window = []
+    previous = 0
+    for number in sorted(n for n in numbers if 1 <= n <= last):
+        if number - previous > 1:
+            window.append(None)
+        window.append(number)
+        previous = number
+    if approximate and previous < last:
+        window.append(None)
+    return window
+
+
+def pagination(request, post_list, count=None, scope=None):
+    """Страница постов.
+
+    count — уже известное точное число постов; scope — область ленты,
+    чьё число постов берётся из кеша (см. counters.feed_post_count).
+    Без них число считается COUNT(*).
+    """
+    match = request.resolver_match
+    if match and match.view_name in settings.CURSOR_PAGINATION_VIEWS:
+        paginator = CursorPaginator(post_list, settings.POSTS_PER_PAGE)
+        return paginator.get_page(request.GET.get('cursor'))
+    if scope is not None:
+        count = feed_post_count(scope, post_list)
+        paginator = CountedPaginator(
+            post_list, settings.POSTS_PER_PAGE, count,
+            approximate=count > settings.PAGINATOR_EXACT_COUNT_LIMIT,
+            on_exact_count=partial(correct_feed_post_count, scope))
+    elif count is not None:
+        paginator = CountedPaginator(post_list, settings.POSTS_PER_PAGE, count)
+    else:
+        paginator = Paginator(post_list, settings.POSTS_PER_PAGE)
     page_number = request.GET.get('page')
     return paginator.get_page(page_number)
+
+
+def cached_pagination(request, ids, count, post_list, source):
+    """Страница по закешированным id первых постов выборки.
+
+    Страница, целиком лежащая в ids, собирается одним in_bulk по
+    первичному ключу из source; дальние страницы листаются обычной
+    пагинацией post_list с уже известным числом постов count.
+    """
+    match = request.resolver_match
+    if match and match.view_name in settings.CURSOR_PAGINATION_VIEWS:
+        return pagination(request, post_list)
+    paginator = CountedPaginator(ids, settings.POSTS_PER_PAGE, count)
+    page = paginator.get_page(request.GET.get('page'))
+    if page.end_index() > len(ids):
+        return pagination(request, post_list, count=count)
+    posts = source.in_bulk(page.object_list)
+    page.object_list = [posts[pk] for pk in page.object_list if pk in posts]
+    return page
+
+
+def comment_page(post_id, cursor=None):
+    """Страница комментариев поста по курсору на (created, id).
+
+    Авторы приходят тем же запросом, а индекс (post, created) отдаёт
+    любую страницу без OFFSET.
+    """
+    paginator = CursorPaginator(
+        Comment.objects.filter(post_id=post_id).select_related('author'),
+        settings.COMMENTS_PER_PAGE,
+        ordering=('created', 'id'),
+    )
+    return paginator.get_page(cursor)
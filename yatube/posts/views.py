@@ -1,17 +1,31 @@
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import redirect, render, get_object_or_404
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.cache import cache_page
 
+from core.replicas import replica_reads
 
-from .models import Post, Group, User, Follow
+from .cache import (FEED, author_scope, group_scope, post_scope,
+                    punched_cache_page, versioned_cache_page)
+from .models import Post, Follow
 from .forms import PostForm, CommentForm
-from .utils import pagination
+from .lookups import group_or_404, user_or_404
+from .counters import stats_for
+from .export import FORMATS as EXPORT_FORMATS, export
+from .search import SearchPaginator
+from .thumbnails import attach_thumbnails, queue as queue_thumbnails
+from .timeline import cached_feed, timeline_posts
+from .utils import cached_pagination, comment_page, pagination
 
+PAGE_CACHE_TIMEOUT = settings.PAGE_CACHE_TIMEOUT
 
-@cache_page(20, key_prefix='index_page')
+
+@replica_reads
+@punched_cache_page(PAGE_CACHE_TIMEOUT, 'index_page', lambda: [FEED])
 def index(request):
-    post_list = Post.objects.select_related('group')
-    page_obj = pagination(request, post_list)
+    post_list = Post.objects.for_feed()
+    page_obj = pagination(request, post_list, scope=FEED)
+    attach_thumbnails(page_obj)
     context = {
         'page_obj': page_obj,
     }
@@ -19,10 +33,14 @@ def index(request):
     return render(request, template, context)
 
 
+@replica_reads
+@punched_cache_page(PAGE_CACHE_TIMEOUT, 'group_page',
+                    lambda slug: [group_scope(slug)])
 def group_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    page_obj = pagination(request, posts)
+    group = group_or_404(slug)
+    posts = group.posts.for_feed()
+    page_obj = pagination(request, posts, scope=group_scope(slug))
+    attach_thumbnails(page_obj)
     context = {
         'page_obj': page_obj,
         'group': group,
@@ -30,25 +48,39 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+@replica_reads
+@punched_cache_page(PAGE_CACHE_TIMEOUT, 'profile_page',
+                    lambda username: [author_scope(username)])
 def profile(request, username):
-    user = get_object_or_404(User, username=username)
-    posts = Post.objects.filter(author=user)
-    post_count = posts.count()
-    page_obj = pagination(request, posts)
-    if request.user.is_authenticated:
-        following = (Follow.objects.
-                     filter(user=request.user, author=user).exists())
-    else:
-        following = False
+    user = user_or_404(username, related=['stats'])
+    stats = stats_for(user)
+    posts = user.posts.for_feed()
+    page_obj = pagination(request, posts, count=stats.post_count)
+    attach_thumbnails(page_obj)
     context = {
         'author': user,
         'page_obj': page_obj,
-        'post_count': post_count,
-        'following': following
+        'post_count': stats.post_count,
+        'stats': stats,
     }
     return render(request, 'posts/profile.html', context)
 
 
+@login_required
+def profile_export(request, username):
+    '''Выгрузка своих постов и комментариев в JSONL или zip'''
+    if request.user.username != username:
+        return redirect('posts:profile', username)
+    fmt = request.GET.get('format', 'jsonl')
+    if fmt not in EXPORT_FORMATS:
+        fmt = 'jsonl'
+    response = StreamingHttpResponse(export(request.user, fmt),
+                                     content_type=EXPORT_FORMATS[fmt])
+    response['Content-Disposition'] = (
+        f'attachment; filename="yatube-{username}.{fmt}"')
+    return response
+
+
 @login_required
 def post_create(request):
     form = PostForm(request.POST or None, files=request.FILES or None)
@@ -58,6 +90,7 @@ def post_create(request):
     post = form.save(commit=False)
     post.author = request.user
     post.save()
+    queue_thumbnails(post)
     return redirect('posts:profile', post.author)
 
 
@@ -72,7 +105,9 @@ def post_edit(request, post_id):
                     instance=edit_post,
                     files=request.FILES or None)
     if form.is_valid():
-        form.save()
+        post = form.save()
+        if 'image' in form.changed_data:
+            queue_thumbnails(post)
         return redirect('posts:post_detail', post_id)
     post_id = edit_post.pk
     return render(request,
@@ -80,18 +115,47 @@ def post_edit(request, post_id):
                   {'form': form, 'is_edit': is_edit, 'post_id': post_id})
 
 
+def post_page_scopes(post_id):
+    '''Области страницы поста: сам пост, его автор и группа'''
+    row = (Post.objects.filter(pk=post_id)
+           .values_list('author__username', 'group__slug').first())
+    if row is None:
+        return [post_scope(post_id)]
+    username, slug = row
+    scopes = [post_scope(post_id), author_scope(username)]
+    if slug:
+        scopes.append(group_scope(slug))
+    return scopes
+
+
+@replica_reads
+@punched_cache_page(PAGE_CACHE_TIMEOUT, 'post_page', post_page_scopes)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
-    form = CommentForm()
-    comments = post.comments.all()
+    post = get_object_or_404(Post.objects.for_detail(), id=post_id)
+    attach_thumbnails([post])
+    comments = comment_page(post.pk)
     context = {
         'post': post,
-        'form': form,
         'comments': comments,
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+@replica_reads
+@versioned_cache_page(PAGE_CACHE_TIMEOUT, 'post_comments',
+                      lambda post_id: [post_scope(post_id)], per_user=False)
+def post_comments(request, post_id):
+    '''HTML следующей порции комментариев для догрузки на странице поста'''
+    comments = comment_page(post_id, request.GET.get('cursor'))
+    if not comments and not Post.objects.filter(pk=post_id).exists():
+        raise Http404
+    context = {
+        'post_id': post_id,
+        'comments': comments,
+    }
+    return render(request, 'posts/includes/comments.html', context)
+
+
 @login_required
 def add_comment(request, post_id):
     post = get_object_or_404(Post, id=post_id)
@@ -105,18 +169,45 @@ def add_comment(request, post_id):
 
 
 @login_required
+@replica_reads
 def follow_index(request):
-    posts = Post.objects.select_related('author').filter(
-        author__following__user=request.user)
-    page_obj = pagination(request, posts)
+    ids, count, pulled = cached_feed(request.user)
+    posts = timeline_posts(request.user, pulled).for_feed()
+    page_obj = cached_pagination(request, ids, count, posts,
+                                 Post.objects.for_feed())
+    attach_thumbnails(page_obj)
     context = {'page_obj': page_obj}
     return render(request, 'posts/follow.html', context)
 
 
+def search(request):
+    '''Поиск по текстам постов'''
+    query = request.GET.get('q', '').strip()
+    group = author = None
+    if request.GET.get('group'):
+        group = group_or_404(request.GET['group'])
+    if request.GET.get('author'):
+        author = user_or_404(request.GET['author'])
+    paginator = SearchPaginator(query, settings.POSTS_PER_PAGE,
+                                group=group, author=author)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+    attach_thumbnails(page_obj)
+    page_query = request.GET.copy()
+    page_query.pop('cursor', None)
+    context = {
+        'page_obj': page_obj,
+        'query': query,
+        'group': group,
+        'author': author,
+        'page_query': page_query.urlencode(),
+    }
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
 def profile_follow(request, username):
     '''Подписка на блогера'''
-    author = get_object_or_404(User, username=username)
+    author = user_or_404(username)
     if author != request.user:
         Follow.objects.get_or_create(user=request.user, author=author)
     return redirect("posts:profile", username=username)
@@ -127,6 +218,6 @@ def profile_unfollow(request, username):
     '''Отписка от блогера'''
     follow = get_object_or_404(Follow,
                                user=request.user,
-                               author__username=username)
+                               author=user_or_404(username))
     follow.delete()
     return redirect("posts:profile", username=username)
@@ -0,0 +1,36 @@
+"""Вход с пользователем из кеша.
+
+AuthenticationMiddleware на каждом запросе вошедшего пользователя
+читает его строку из базы. Здесь пользователь по id берётся из кеша,
+а из базы — только при промахе. Запись сбрасывают сигналы сохранения
+и удаления пользователя: смена пароля, правка профиля и вход
+(last_login) сразу видны всем воркерам. Смена пароля к тому же меняет
+хеш сессии, так что остальные сессии пользователя завершаются, как и
+без кеша.
+
+Изменения через QuerySet.update сигналов не посылают: после них нужно
+вызвать forget_user.
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+
+def _key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def forget_user(*user_ids):
+    cache.delete_many([_key(user_id) for user_id in user_ids])
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        key = _key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is None:
+                return None
+            cache.set(key, user, settings.AUTH_USER_CACHE_TIMEOUT)
+        return user if self.user_can_authenticate(user) else None
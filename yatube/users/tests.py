@@ -0,0 +1,63 @@
+from django.contrib.auth import (BACKEND_SESSION_KEY, HASH_SESSION_KEY,
+                                 SESSION_KEY, get_user_model)
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from .backends import CachedModelBackend
+
+User = get_user_model()
+
+
+class CachedAuthTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth',
+                                            password='old-secret-1')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.user)
+        self.url = reverse('about:author')
+
+    def test_logged_in_request_skips_auth_queries(self):
+        '''Сессия и пользователь читаются из кеша'''
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.context['user'], self.user)
+
+    def test_profile_change_invalidates_cached_user(self):
+        '''Правка пользователя сразу видна в запросах'''
+        backend = CachedModelBackend()
+        backend.get_user(self.user.pk)
+        user = User.objects.get(pk=self.user.pk)
+        user.first_name = 'Новое имя'
+        user.save()
+        self.assertEqual(backend.get_user(self.user.pk).first_name,
+                         'Новое имя')
+        user.is_active = False
+        user.save()
+        self.assertIsNone(backend.get_user(self.user.pk))
+
+    def test_password_change_ends_other_sessions(self):
+        '''Смена пароля завершает сессии со старым паролем'''
+        self.client.get(self.url)
+        user = User.objects.get(pk=self.user.pk)
+        user.set_password('new-secret-2')
+        user.save()
+        response = self.client.get(self.url)
+        self.assertFalse(response.context['user'].is_authenticated)
+
+    def test_sessions_of_model_backend_kept(self):
+        '''Сессии, открытые до перехода на кеш, не разлогиниваются'''
+        session = self.client.session
+        session[SESSION_KEY] = str(self.user.pk)
+        session[BACKEND_SESSION_KEY] = (
+            'django.contrib.auth.backends.ModelBackend')
+        session[HASH_SESSION_KEY] = self.user.get_session_auth_hash()
+        session.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['user'], self.user)
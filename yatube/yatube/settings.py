@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import sys
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -22,6 +23,8 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = '^%&e6*^2975a#s6qp-#7j%j#nlf7z6!z%(zkc*lqu=ee9jo8i-'
 
+TESTING = 'test' in sys.argv or 'pytest' in sys.modules
+
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
@@ -51,6 +54,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.profiling.SQLProfilingMiddleware',
+    'core.replicas.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -90,9 +95,30 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+    },
+    # Локальная реплика: копия основной базы, которую обновляет команда
+    # sync_replica. В тестах — зеркало основной базы.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db_replica.sqlite3'),
+        'TEST': {'MIRROR': 'default'},
+    },
 }
 
+DATABASE_ROUTERS = ['core.replicas.ReplicaRouter']
+
+# Реплики, с которых читают ленты, профиль и страница поста; пустой
+# список — всё читается с основной базы. Чтобы проверить локально,
+# запустите sync_replica и добавьте сюда 'replica'.
+DATABASE_REPLICAS = ()
+
+# Сколько секунд после записи пользователь читает с основной базы,
+# чтобы увидеть своё, пока реплика догоняет.
+REPLICA_STICKY_SECONDS = 10
+# На сколько секунд реплика может отстать. Страницы и ленты, изменённые
+# позже, собираются для кеша с основной базы; 0 — реплика не отстаёт.
+REPLICA_MAX_LAG = REPLICA_STICKY_SECONDS
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -138,6 +164,18 @@ LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
 # LOGOUT_REDIRECT_URL = 'posts:index'
 
+# Сессии читаются из кеша и пишутся и в кеш, и в базу; пользователь
+# по id тоже берётся из кеша (см. users.backends). Вошедший посетитель
+# обычно не стоит ни одного запроса на сессию и пользователя.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+# ModelBackend остаётся для сессий, открытых до перехода на кеш: сессия
+# помнит путь бэкенда, и без него пользователь вышел бы из сайта.
+AUTHENTICATION_BACKENDS = [
+    'users.backends.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+AUTH_USER_CACHE_TIMEOUT = 60 * 60
+
 
 EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 
@@ -145,13 +183,131 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 POSTS_PER_PAGE = 10
 
+# Число постов ленты и группы для пагинации берётся из кеша. До этого
+# порога оно точное, выше — оценка по датам последних постов, и ссылка
+# на последнюю страницу не показывается. PAGINATOR_WINDOW — сколько
+# номеров страниц показывать с каждой стороны от текущей.
+PAGINATOR_EXACT_COUNT_LIMIT = 5000
+PAGINATOR_WINDOW = 3
+
+# Сколько комментариев показывать на странице поста; остальные
+# догружаются фрагментами по той же порции.
+COMMENTS_PER_PAGE = 20
+
+# Сколько последних постов отдают RSS и Atom.
+FEED_LENGTH = 20
+
+# Ленты, которые листаются курсором по (pub_date, id) вместо номеров
+# страниц, например ('posts:index', 'posts:group_list').
+CURSOR_PAGINATION_VIEWS = ()
+
+# Лента подписок: сколько записей хранить на читателя, при каком числе
+# подписчиков автор читается при запросе, а не рассылается, и на каждом
+# каком посте автора обрезать ленты его подписчиков.
+TIMELINE_LENGTH = 500
+TIMELINE_FANOUT_LIMIT = 1000
+TIMELINE_TRIM_INTERVAL = 20
+
+# Сколько держать в кеше группу или пользователя, найденных по адресу
+# (сбрасываются сигналами при изменении), и отметку о ненайденном.
+LOOKUP_CACHE_TIMEOUT = 60 * 60
+LOOKUP_MISS_TIMEOUT = 60
+
+# Сколько первых страниц ленты подписок держать в кеше списком id.
+FOLLOW_FEED_CACHED_PAGES = 5
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Страницы лент сбрасываются сигналами при изменении постов, групп и
+# комментариев, поэтому могут жить в кеше долго.
+PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+# Версии областей живут не меньше страниц, собранных под ними; истёкшая
+# версия лишь заставляет пересобрать страницы своей области.
+VERSION_CACHE_TIMEOUT = PAGE_CACHE_TIMEOUT * 2
+
+# Сколько процессов режут миниатюры после загрузки картинки; 0 — резать
+# в том же процессе сразу после коммита.
+THUMBNAIL_WORKERS = 2
+
+# Сколько строк выгрузка читает из базы за один запрос.
+EXPORT_CHUNK_SIZE = 2000
+
+CACHE_DIR = os.path.join(BASE_DIR, 'cache')
+
+# L1 в памяти каждого воркера перед общим для всех процессов L2.
+# Изменения ключей рассылаются воркерам через журнал инвалидаций.
 CACHES = {
     'default': {
+        'BACKEND': 'core.cache.TwoTierCache',
+        'OPTIONS': {
+            'L2': 'shared',
+            'BUS': os.path.join(CACHE_DIR, 'invalidations.sqlite3'),
+            'L1_MAX_ENTRIES': 1000,
+            'L1_TIMEOUT': 60,
+            'POLL_INTERVAL': 0.25,
+        },
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(CACHE_DIR, 'shared'),
+        'TIMEOUT': PAGE_CACHE_TIMEOUT,
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+}
+
+if TESTING:
+    # Тесты не должны видеть кеш, оставшийся от прошлых запусков.
+    CACHES['default']['OPTIONS']['BUS'] = ':memory:'
+    CACHES['shared'] = {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
+    THUMBNAIL_WORKERS = 0
+
+# Профилирование SQL: доля запросов к сайту, для которых собирается
+# статистика, порог медленного запроса в мс, сколько медленных запросов
+# с планом хранить на запрос и размер кольцевого буфера в памяти.
+SQL_PROFILING = {
+    'SAMPLE_RATE': 0.02,
+    'SLOW_QUERY_MS': 100,
+    'MAX_SLOW_QUERIES': 5,
+    'BUFFER_SIZE': 500,
 }
 
+# Защита кешированных страниц от одновременной пересборки (см.
+# core.stampede): сколько живёт блокировка сборки, сколько ждать чужую
+# сборку без прошлой копии и множитель ранней пересборки.
+STAMPEDE = {
+    'LOCK_TIMEOUT': 10,
+    'WAIT': 2.0,
+    'BETA': 1.0,
+}
+
+LOG_DIR = os.path.join(BASE_DIR, 'logs')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'sql_profile': {
+            'class': 'core.profiling.ProfileLogHandler',
+            'filename': os.path.join(LOG_DIR, 'sql_profile.log'),
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'encoding': 'utf-8',
+        },
+    },
+    'loggers': {
+        'core.profiling': {
+            'handlers': ['sql_profile'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+if TESTING:
+    SQL_PROFILING['SAMPLE_RATE'] = 0
+    LOGGING['handlers']['sql_profile'] = {'class': 'logging.NullHandler'}
+
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'